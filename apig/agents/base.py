@@ -1,10 +1,14 @@
 from __future__ import annotations
+import asyncio
 from abc import ABC, abstractmethod
-from typing import List
+from typing import List, Sequence
 from apig.env.types import ToolCall, ToolResult, TraceEvent
 
 class Agent(ABC):
     name: str
+    # True if run() depends only on (prompt, tool results). The runner may then
+    # execute each task variant once and replicate the result across episodes.
+    deterministic: bool = False
 
     @abstractmethod
     def run(self, prompt: str, tools: "ToolInterface") -> List[TraceEvent]:
@@ -13,7 +17,51 @@ class Agent(ABC):
         """
         raise NotImplementedError
 
+    async def arun(self, prompt: str, tools: "ToolInterface") -> List[TraceEvent]:
+        """Async variant of run(). Agents that wait on I/O (e.g. LLM calls)
+        should override this; the default simply runs the episode inline.
+        """
+        return self.run(prompt, tools)
+
+    def close(self) -> None:
+        """Release resources held across episodes (called once per run)."""
+        pass
+
+    async def aclose(self) -> None:
+        """Release async resources (e.g. pooled async HTTP clients) on the
+        event loop that used them; async runs call this before close()."""
+        pass
+
 class ToolInterface(ABC):
     @abstractmethod
     def call(self, call: ToolCall) -> ToolResult:
         raise NotImplementedError
+
+    async def acall(self, call: ToolCall) -> ToolResult:
+        # Sandbox tools are in-memory and deterministic, so there is nothing to await.
+        return self.call(call)
+
+    def is_read_only(self, name: str) -> bool:
+        """True if calls to `name` only read state (safe to run concurrently)."""
+        return False
+
+    def call_batch(self, calls: Sequence[ToolCall]) -> List[ToolResult]:
+        return [self.call(c) for c in calls]
+
+    async def acall_batch(self, calls: Sequence[ToolCall]) -> List[ToolResult]:
+        """Results of `calls`, in order. Runs of consecutive read-only calls
+        are awaited together; any other call waits for everything before it,
+        so side effects happen in the order given."""
+        results: List[ToolResult] = []
+        i = 0
+        while i < len(calls):
+            j = i
+            while j < len(calls) and self.is_read_only(calls[j].name):
+                j += 1
+            if j > i:
+                results.extend(await asyncio.gather(*(self.acall(c) for c in calls[i:j])))
+                i = j
+            else:
+                results.append(await self.acall(calls[i]))
+                i += 1
+        return results
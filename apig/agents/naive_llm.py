@@ -12,6 +12,7 @@ class NaiveLLMAgent(Agent):
     This is *intentionally vulnerable* to indirect prompt injection.
     """
     name = "naive"
+    deterministic = True
 
     def run(self, prompt: str, tools: ToolInterface) -> List[TraceEvent]:
         trace: List[TraceEvent] = []
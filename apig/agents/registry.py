@@ -1,15 +1,21 @@
 from __future__ import annotations
-from typing import Dict, Type, Any, Optional
+from typing import Dict, Type, Any, Optional, Tuple
 from .base import Agent
 from .rule_based import RuleBasedAgent
 from .naive_llm import NaiveLLMAgent
 from .llm_agent import LLMDrivenAgent, LLMConfig
+from apig.llm.providers.http import HTTPOptions
 
 AGENTS: Dict[str, Type[Agent]] = {
     "rule": RuleBasedAgent,
     "naive": NaiveLLMAgent,
 }
 
+def is_deterministic(name: str) -> bool:
+    """Whether the named agent declares itself deterministic (without building it)."""
+    cls = AGENTS.get(name.lower().strip())
+    return bool(cls and cls.deterministic)
+
 def get_agent(
     name: str,
     *,
@@ -17,6 +23,21 @@ def get_agent(
     llm_model: Optional[str] = None,
     llm_api_key: Optional[str] = None,
     llm_cache_path: Optional[str] = None,
+    llm_cache_keep_raw: bool = True,
+    llm_max_concurrency: Optional[int] = None,
+    llm_base_url: Optional[str] = None,
+    llm_http: Optional[HTTPOptions] = None,
+    llm_rpm: Optional[float] = None,
+    llm_tpm: Optional[float] = None,
+    llm_max_retries: int = 5,
+    llm_coalesce: bool = True,
+    llm_provider_options: Optional[Dict[str, Any]] = None,
+    llm_record_path: Optional[str] = None,
+    llm_prices: Optional[Dict[str, Tuple[float, float]]] = None,
+    llm_timing: bool = False,
+    llm_multi_turn: bool = False,
+    llm_stream: bool = False,
+    llm_batch_tools: bool = False,
     max_steps: int = 8,
     max_tool_calls: int = 6,
 ) -> Agent:
@@ -41,6 +62,21 @@ def get_agent(
             max_output_tokens=512,
             timeout_s=60.0,
             cache_path=llm_cache_path,
+            cache_keep_raw=llm_cache_keep_raw,
+            max_concurrency=llm_max_concurrency,
+            base_url=llm_base_url,
+            http=llm_http or HTTPOptions(),
+            requests_per_minute=llm_rpm,
+            tokens_per_minute=llm_tpm,
+            max_retries=llm_max_retries,
+            coalesce=llm_coalesce,
+            provider_options=dict(llm_provider_options or {}),
+            record_path=llm_record_path,
+            prices=llm_prices,
+            timing=llm_timing,
+            multi_turn=llm_multi_turn,
+            stream=llm_stream,
+            batch_tools=llm_batch_tools,
         )
         defended = name == "llm_defended"
         return LLMDrivenAgent(name=name, config=cfg, defended=defended, max_steps=max_steps, max_tool_calls=max_tool_calls)
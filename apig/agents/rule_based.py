@@ -8,6 +8,7 @@ class RuleBasedAgent(Agent):
     It ignores any 'injection' because it never treats retrieved/untrusted content as instructions.
     """
     name = "rule"
+    deterministic = True
 
     def run(self, prompt: str, tools: ToolInterface) -> List[TraceEvent]:
         trace: List[TraceEvent] = []
@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import mmap
+import os
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from apig.env.trace import BlobRef, TraceStore
+from apig.env.types import EpisodeResult, TraceEvent
+
+_MANIFEST = "archive.json"
+_INDEX = "index.jsonl"
+_BLOBS = "blobs.dat"
+_BLOB_INDEX = "blobs.idx"
+_BLOB_KEY = "$blob"
+
+
+def _segment_name(n: int, compress: bool) -> str:
+    return f"seg-{n:05d}.jsonl" + (".gz" if compress else "")
+
+
+def _read_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    # A torn final line (crash mid-append) is ignored.
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                return
+            try:
+                yield json.loads(line)
+            except ValueError:
+                return
+
+
+def _encode(v: Any) -> Any:
+    if isinstance(v, BlobRef):
+        return {_BLOB_KEY: v.digest}
+    if isinstance(v, dict):
+        return {k: _encode(x) for k, x in v.items()}
+    if isinstance(v, (list, tuple)):
+        return [_encode(x) for x in v]
+    return v
+
+
+class TraceArchiveWriter:
+    """Spills episode traces to a content-addressed directory.
+
+    Layout under `root`:
+
+    - `seg-NNNNN.jsonl[.gz]`: trace records (one JSON array of `[t, kind, data]`
+      rows each); with compression every record is its own gzip member, so it
+      can be decompressed on its own
+    - `index.jsonl`: `{"episode_id", "attack_id", "digest", "segment", "offset", "length"}`
+    - `blobs.dat` / `blobs.idx`: large payloads, stored once per content hash
+
+    Identical records (e.g. memoized episodes) are stored once and indexed
+    many times. Opening an existing archive appends to it.
+    """
+
+    def __init__(self, root: str, compress: bool = True, segment_bytes: int = 64 << 20):
+        self.root = root
+        self.segment_bytes = segment_bytes
+        os.makedirs(root, exist_ok=True)
+        manifest = os.path.join(root, _MANIFEST)
+        if os.path.exists(manifest):
+            with open(manifest, encoding="utf-8") as f:
+                compress = bool(json.load(f)["compress"])
+        else:
+            with open(manifest, "w", encoding="utf-8") as f:
+                json.dump({"version": 1, "compress": compress}, f)
+        self.compress = compress
+
+        self._records: Dict[str, Tuple[int, int, int]] = {}
+        segment = 0
+        for e in _read_jsonl(os.path.join(root, _INDEX)):
+            self._records[e["digest"]] = (e["segment"], e["offset"], e["length"])
+            segment = max(segment, e["segment"])
+        self._blobs = {e["digest"] for e in _read_jsonl(os.path.join(root, _BLOB_INDEX))}
+
+        self._segment = segment
+        self._seg: BinaryIO = open(os.path.join(root, _segment_name(segment, compress)), "ab")
+        self._index = open(os.path.join(root, _INDEX), "a", encoding="utf-8")
+        self._blob_data = open(os.path.join(root, _BLOBS), "ab")
+        self._blob_index = open(os.path.join(root, _BLOB_INDEX), "a", encoding="utf-8")
+
+    def _put_blob(self, digest: str, text: str) -> None:
+        if digest in self._blobs:
+            return
+        data = text.encode("utf-8")
+        if self.compress:
+            data = gzip.compress(data, mtime=0)
+        offset = self._blob_data.tell()
+        self._blob_data.write(data)
+        self._blob_index.write(json.dumps({"digest": digest, "offset": offset, "length": len(data)}) + "\n")
+        self._blobs.add(digest)
+
+    def _put_record(self, trace: TraceStore) -> Tuple[str, Tuple[int, int, int]]:
+        rows = [[t, kind, _encode(data)] for t, kind, data in trace.compact_rows()]
+        data = json.dumps(rows, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        loc = self._records.get(digest)
+        if loc is not None:
+            return digest, loc
+        for d in trace.blob_digests():
+            self._put_blob(d, trace.blob(d))
+        if self.compress:
+            data = gzip.compress(data, mtime=0)
+        if self._seg.tell() >= self.segment_bytes:
+            self._seg.close()
+            self._segment += 1
+            self._seg = open(os.path.join(self.root, _segment_name(self._segment, self.compress)), "ab")
+        loc = (self._segment, self._seg.tell(), len(data))
+        self._seg.write(data + (b"" if self.compress else b"\n"))
+        self._records[digest] = loc
+        return digest, loc
+
+    def add(self, r: EpisodeResult) -> None:
+        trace = r.trace if isinstance(r.trace, TraceStore) and r.trace.level == "full" else TraceStore(r.trace)
+        digest, (segment, offset, length) = self._put_record(trace)
+        entry = {
+            "episode_id": r.episode_id,
+            "attack_id": r.attack_id,
+            "digest": digest,
+            "segment": segment,
+            "offset": offset,
+            "length": length,
+        }
+        self._index.write(json.dumps(entry) + "\n")
+
+    def flush(self) -> None:
+        # Data before indexes, so an index entry never points past the data.
+        for f in (self._seg, self._blob_data, self._blob_index, self._index):
+            f.flush()
+
+    def close(self) -> None:
+        if self._index.closed:
+            return
+        self.flush()
+        for f in (self._seg, self._blob_data, self._blob_index, self._index):
+            f.close()
+
+    def __enter__(self) -> "TraceArchiveWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class TraceArchive:
+    """Read side of a trace archive: memory-maps segments and blobs lazily,
+    so fetching one episode touches only that episode's bytes."""
+
+    def __init__(self, root: str):
+        self.root = root
+        with open(os.path.join(root, _MANIFEST), encoding="utf-8") as f:
+            self.compress = bool(json.load(f)["compress"])
+        self.index: Dict[str, List[Dict[str, Any]]] = {}
+        for e in _read_jsonl(os.path.join(root, _INDEX)):
+            self.index.setdefault(e["episode_id"], []).append(e)
+        self._blob_index = {e["digest"]: (e["offset"], e["length"]) for e in _read_jsonl(os.path.join(root, _BLOB_INDEX))}
+        self._maps: Dict[str, mmap.mmap] = {}
+
+    def _map(self, name: str) -> mmap.mmap:
+        m = self._maps.get(name)
+        if m is None:
+            with open(os.path.join(self.root, name), "rb") as f:
+                m = self._maps[name] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return m
+
+    def _read(self, name: str, offset: int, length: int) -> bytes:
+        data = self._map(name)[offset : offset + length]
+        return gzip.decompress(data) if self.compress else data
+
+    def _blob(self, digest: str) -> str:
+        offset, length = self._blob_index[digest]
+        return self._read(_BLOBS, offset, length).decode("utf-8")
+
+    def _decode(self, v: Any) -> Any:
+        if isinstance(v, dict):
+            if len(v) == 1 and _BLOB_KEY in v:
+                return self._blob(v[_BLOB_KEY])
+            return {k: self._decode(x) for k, x in v.items()}
+        if isinstance(v, list):
+            return [self._decode(x) for x in v]
+        return v
+
+    def entries(self, episode_id: str) -> List[Dict[str, Any]]:
+        """Index entries for an episode id (one per attack variant sharing it)."""
+        return self.index.get(episode_id, [])
+
+    def trace(self, entry: Dict[str, Any]) -> List[TraceEvent]:
+        raw = self._read(_segment_name(entry["segment"], self.compress), entry["offset"], entry["length"])
+        return [TraceEvent(t=t, kind=kind, data=self._decode(data)) for t, kind, data in json.loads(raw)]
+
+    def get(self, episode_id: str, attack_id: Optional[str] = None) -> List[TraceEvent]:
+        for e in self.entries(episode_id):
+            if e["attack_id"] == attack_id:
+                return self.trace(e)
+        raise KeyError(f"{episode_id} (attack_id={attack_id})")
+
+    def close(self) -> None:
+        for m in self._maps.values():
+            m.close()
+        self._maps.clear()
+
+    def __enter__(self) -> "TraceArchive":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
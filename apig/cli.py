@@ -1,19 +1,39 @@
 from __future__ import annotations
 import json
+import os
+import time
 import typer
 from rich.console import Console
+from rich.console import Group as RenderGroup
+from rich.live import Live
 from rich.table import Table
+from dataclasses import replace
+from functools import partial
 from pathlib import Path
 from typing import Optional, List
 
-from apig.suites.registry import get_suite, SUITES
-from apig.agents.registry import get_agent, AGENTS
-from apig.env.tools import SandboxState
+from apig.suites.registry import SUITES
+from apig.agents.registry import get_agent, is_deterministic, AGENTS
 from apig.attacks.io import load_attack_file
-from apig.harness import run_task
-from apig.scoring import summarize, to_dict
+from apig.runner import EpisodeOptions, plan_variants, plan_episodes, run_episodes, memoize_episodes
+from apig.env.trace import TRACE_LEVELS
+from apig.journal import RunJournal, agent_identity, resume_episodes
+from apig.scoring import GROUP_KEYS, GroupedScoreAccumulator, ScoreAccumulator, groups_to_dict, to_dict
+from apig.scoring import bootstrap_ci, paired_compare, paired_outcomes
+from apig.report import JsonlReportWriter, iter_report_episodes, write_json_report
+from apig.archive import TraceArchive, TraceArchiveWriter
+from apig.loadtest import run_loadtest
+from apig.llm.accounting import load_prices
+from apig.llm.cache import LLMCache
+from apig.llm.providers.http import HTTPOptions
+from apig.llm.providers.replay import ReplayProvider
+from apig.llm.stub_server import StubProfile, StubServer, replay_responder
 
 app = typer.Typer(add_completion=False)
+report_app = typer.Typer(add_completion=False, help="Inspect run outputs.")
+app.add_typer(report_app, name="report")
+cache_app = typer.Typer(add_completion=False, help="Maintain an LLM cache file.")
+app.add_typer(cache_app, name="cache")
 console = Console()
 
 def _load_attacks(paths: List[str]) -> List:
@@ -40,6 +60,53 @@ def validate(path: str = typer.Argument(..., help="Path to attacks folder or YAM
             console.print(f"[red]FAIL[/red] {f}: {e}")
     raise typer.Exit(code=0 if ok else 1)
 
+def _replay_options(sources: List[str], recorded_as: Optional[str], strict: bool, latency: Optional[str], seed: int) -> dict:
+    if not sources:
+        raise typer.BadParameter("--llm-provider replay needs --replay-from")
+    transcripts = [s for s in sources if s.endswith((".jsonl", ".ndjson"))]
+    caches = [s for s in sources if s not in transcripts]
+    if len(transcripts) > 1 or len(caches) > 1:
+        raise typer.BadParameter("--replay-from takes at most one cache database and one transcript")
+    return {
+        "cache_path": caches[0] if caches else None,
+        "transcript": transcripts[0] if transcripts else None,
+        "strict": strict,
+        "recorded_as": recorded_as,
+        "latency": latency,
+        "seed": seed,
+    }
+
+_GROUP_COLUMNS = ("episodes", "CTS", "RTS", "UAR", "SER", "leak_step_mean")
+
+def _usage_cell(key: str, v: float) -> str:
+    if key.startswith("cost_usd"):
+        return f"${v:.4f}"
+    if key.startswith("latency_ms"):
+        return f"{v:.1f}"
+    return f"{v:.1f}" if isinstance(v, float) else str(v)
+
+def _score_tables(title: str, acc: GroupedScoreAccumulator) -> RenderGroup:
+    table = Table(title=title)
+    table.add_column("Metric")
+    table.add_column("Value")
+    summary = to_dict(acc.summary())
+    usage = summary.pop("llm_usage", {})
+    for k, v in summary.items():
+        table.add_row(k, f"{v:.3f}" if isinstance(v, float) else str(v))
+    for k, v in usage.items():
+        table.add_row(f"llm.{k}", _usage_cell(k, v))
+    tables = [table]
+    for g, by_key in acc.group_summaries().items():
+        t = Table(title=f"by {g}")
+        t.add_column(g)
+        for c in _GROUP_COLUMNS:
+            t.add_column(c, justify="right")
+        for key, s in by_key.items():
+            row = to_dict(s)
+            t.add_row(key, *[f"{row[c]:.3f}" if isinstance(row[c], float) else str(row[c]) for c in _GROUP_COLUMNS])
+        tables.append(t)
+    return RenderGroup(*tables)
+
 @app.command()
 def run(
     suite: str = typer.Option("all", help=f"Suite name: one of {list(SUITES)} or 'all'"),
@@ -48,20 +115,86 @@ def run(
     seed: int = typer.Option(0, help="Deterministic seed (currently used only for episode id)."),
     attacks: List[str] = typer.Option([], help="Attack YAML files/folders. If omitted, uses built-in examples in ./attacks"),
     out: Optional[str] = typer.Option(None, help="Write full JSON results to this path."),
+    journal: Optional[str] = typer.Option(None, help="Append finished episodes to this run journal (for --resume)."),
+    resume: Optional[str] = typer.Option(None, help="Resume from a run journal: skip its completed episodes and keep appending to it."),
+    trace_archive: Optional[str] = typer.Option(None, help="Spill traces to this archive directory (see `apig report show`); reports then omit them."),
+    out_format: str = typer.Option("json", help="Report format: json (one document) or jsonl (one episode per line, streamed)."),
     max_attacks: int = typer.Option(3, help="Number of attacks to sample per suite (0 = none, -1 = all)."),
     max_steps: int = typer.Option(8, help="Max agent steps per episode (LLM agents)."),
     max_tool_calls: int = typer.Option(6, help="Max tool calls per episode (LLM agents)."),
-    llm_provider: Optional[str] = typer.Option(None, help="LLM provider for llm_* agents: openai|gemini"),
+    llm_provider: Optional[str] = typer.Option(None, help="LLM provider for llm_* agents: openai|gemini|replay"),
     llm_model: Optional[str] = typer.Option(None, help="Model id for provider, e.g. gpt-4.1-mini or gemini-1.5-pro"),
     llm_api_key: Optional[str] = typer.Option(None, help="API key (optional). If omitted uses OPENAI_API_KEY or GEMINI_API_KEY"),
     llm_cache_path: Optional[str] = typer.Option(None, help="SQLite cache path for LLM calls (recommended for reproducibility)."),
+    llm_cache_raw: bool = typer.Option(True, help="Keep full provider responses in the LLM cache (--no-llm-cache-raw: text and usage only)."),
+    workers: int = typer.Option(1, help="Worker processes for running episodes (results keep serial order)."),
+    concurrency: int = typer.Option(1, help="Episodes in flight at once on an asyncio loop (useful for LLM agents)."),
+    llm_max_concurrency: Optional[int] = typer.Option(None, help="Cap on concurrent requests per LLM provider (async runs)."),
+    llm_rpm: Optional[float] = typer.Option(None, help="Provider request budget per minute (split evenly across --workers)."),
+    llm_tpm: Optional[float] = typer.Option(None, help="Provider token budget per minute (split evenly across --workers)."),
+    llm_max_retries: int = typer.Option(5, help="Retries for throttled (429/503) or transiently failing LLM calls."),
+    llm_record: Optional[str] = typer.Option(None, help="Append every LLM exchange to this transcript (JSONL) for later replay."),
+    replay_from: List[str] = typer.Option([], help="--llm-provider replay: cache databases (.sqlite/.db) and/or transcripts (.jsonl) to serve."),
+    replay_as: Optional[str] = typer.Option(None, help="--llm-provider replay: provider the responses were recorded with (e.g. openai)."),
+    replay_strict: bool = typer.Option(True, help="--llm-provider replay: fail on a miss (--no-replay-strict: answer with a scripted policy)."),
+    replay_latency: Optional[str] = typer.Option(None, help="--llm-provider replay: simulated latency, e.g. fixed:0.5, uniform:0.2,1.5, exp:0.8, lognormal:-0.5,0.6."),
+    llm_coalesce: bool = typer.Option(True, help="Share one provider call between concurrent identical LLM requests."),
+    llm_base_url: Optional[str] = typer.Option(None, help="Override the provider API base URL (e.g. an OpenAI-compatible server)."),
+    llm_http2: bool = typer.Option(False, help="Use HTTP/2 for provider requests (needs httpx[http2])."),
+    llm_max_connections: int = typer.Option(100, help="Max pooled HTTP connections per provider client."),
+    llm_max_keepalive: int = typer.Option(20, help="Max idle keep-alive connections per provider client."),
+    llm_prices: Optional[str] = typer.Option(None, help='JSON price table {"model": [prompt_usd, completion_usd]} per 1M tokens, merged over the built-in one.'),
+    llm_multi_turn: bool = typer.Option(False, help="Send each episode as one growing conversation (stable prefix for provider prompt caching)."),
+    llm_stream: bool = typer.Option(False, help="Stream completions and stop reading once a complete action JSON has arrived."),
+    llm_batch_tools: bool = typer.Option(False, help="Tell LLM agents they may send several tool calls per step (read-only ones run concurrently)."),
+    llm_timing: bool = typer.Option(False, help="Record per-call LLM latency in traces and the summary (makes traces differ run to run)."),
+    memoize: bool = typer.Option(True, help="Run each variant once for deterministic agents (rule/naive) and replicate it."),
+    detect_encoded_canaries: bool = typer.Option(False, help="Also count base64/hex/URL-encoded/spaced-out canaries as sensitive egress."),
+    tool_timing: bool = typer.Option(False, help="Record per-tool call counts and cumulative latency in each trace."),
+    trace_level: str = typer.Option("full", help="Trace detail per episode: full, summary (tool names/outcomes, no payloads) or none."),
+    group_by: List[str] = typer.Option([], help=f"Also score per group; repeatable, one of {list(GROUP_KEYS)}."),
+    live: bool = typer.Option(False, help="Show the (grouped) score tables live while episodes run."),
+    verify_determinism: int = typer.Option(0, help="With memoization, really run this many extra episodes per variant and check they match."),
 ):
-    agent_obj = get_agent(
+    if workers > 1 and concurrency > 1:
+        raise typer.BadParameter("use either --workers or --concurrency, not both")
+    if out_format not in ("json", "jsonl"):
+        raise typer.BadParameter("--out-format must be 'json' or 'jsonl'")
+    if trace_level not in TRACE_LEVELS:
+        raise typer.BadParameter(f"--trace-level must be one of {list(TRACE_LEVELS)}")
+    if journal and not resume and os.path.exists(journal) and os.path.getsize(journal) > 0:
+        # Appending to an earlier run's journal would silently resume it.
+        raise typer.BadParameter(f"{journal} already has episodes; use --resume {journal} to continue it, or pick a new path")
+    try:
+        acc = GroupedScoreAccumulator(group_by)
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+
+    agent_factory = partial(
+        get_agent,
         agent,
         llm_provider=llm_provider,
         llm_model=llm_model,
         llm_api_key=llm_api_key,
         llm_cache_path=llm_cache_path,
+        llm_cache_keep_raw=llm_cache_raw,
+        llm_max_concurrency=llm_max_concurrency,
+        llm_base_url=llm_base_url,
+        # Each worker process has its own buckets.
+        llm_rpm=llm_rpm / max(1, workers) if llm_rpm else None,
+        llm_tpm=llm_tpm / max(1, workers) if llm_tpm else None,
+        llm_max_retries=llm_max_retries,
+        llm_coalesce=llm_coalesce,
+        llm_provider_options=_replay_options(replay_from, replay_as, replay_strict, replay_latency, seed)
+        if (llm_provider or "").lower() == "replay"
+        else None,
+        llm_record_path=llm_record,
+        llm_prices=load_prices(llm_prices) if llm_prices else None,
+        llm_timing=llm_timing,
+        llm_multi_turn=llm_multi_turn,
+        llm_stream=llm_stream,
+        llm_batch_tools=llm_batch_tools,
+        llm_http=HTTPOptions(max_connections=llm_max_connections, max_keepalive_connections=llm_max_keepalive, http2=llm_http2),
         max_steps=max_steps,
         max_tool_calls=max_tool_calls,
     )
@@ -85,74 +218,317 @@ def run(
         attack_specs = _load_attacks(paths)
 
     suite_names = list(SUITES) if suite == "all" else [suite]
-    all_results = []
-
-    for sn in suite_names:
-        s = get_suite(sn)
-        # Run: clean task + a sample of attacks
-        if max_attacks == 0:
-            atk_sample = []
-        elif max_attacks < 0:
-            atk_sample = attack_specs
-        else:
-            atk_sample = attack_specs[:max_attacks] if attack_specs else []
-        variants = [None] + atk_sample
-
-        for atk in variants:
-            tasks = s.tasks(atk)
-            for task in tasks:
-                for i in range(episodes):
-                    # fresh state for determinism
-                    st = SandboxState(files={}, inbox=[], web={}, retrieved_docs={}, forms={}, outbox=[], http_posts=[])
-                    task.setup(st, atk)
-                    # canaries: pull from state by regex convention
-                    canaries = []
-                    # harvest canaries from any state strings
-                    for v in list(st.files.values()) + [m.get("body","") for m in st.inbox] + list(st.web.values()):
-                        for m in __import__("re").findall(r"CANARY-[A-Z0-9\-]+", str(v)):
-                            canaries.append(m)
-                    # run
-                    res = run_task(agent_obj, task, st, sorted(set(canaries)), sn, seed, i)
-                    all_results.append(res)
-
-    summary = summarize(all_results)
-
-    table = Table(title=f"APIG v0.1 results (agent={agent}, suite={suite})")
-    table.add_column("Metric")
-    table.add_column("Value")
-    for k, v in to_dict(summary).items():
-        table.add_row(k, f"{v:.3f}" if isinstance(v, float) else str(v))
-    console.print(table)
+    # Run: clean task + a sample of attacks
+    variants = plan_variants(attack_specs, max_attacks)
+    specs = plan_episodes(suite_names, variants, episodes)
+    options = EpisodeOptions(
+        detect_encoded_canaries=detect_encoded_canaries, tool_timing=tool_timing, trace_level=trace_level
+    )
+
+    def run_specs(todo):
+        return run_episodes(todo, agent_factory, variants, seed, workers=workers, concurrency=concurrency, options=options)
+
+    if memoize and is_deterministic(agent):
+        run_all = run_specs
+
+        def run_specs(todo):
+            return memoize_episodes(todo, seed, run_all, verify=verify_determinism)
+
+    journal_path = journal or resume
+    # Options that change episode results; a resume must use the same ones.
+    journal_settings = dict(
+        trace_level=trace_level,
+        max_steps=max_steps,
+        max_tool_calls=max_tool_calls,
+        detect_encoded_canaries=detect_encoded_canaries,
+        tool_timing=tool_timing,
+        llm_multi_turn=llm_multi_turn,
+        llm_batch_tools=llm_batch_tools,
+        llm_stream=llm_stream,
+        llm_timing=llm_timing,
+    )
+    try:
+        run_journal = RunJournal(journal_path, settings=journal_settings) if journal_path else None
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+    if run_journal is not None:
+        if resume:
+            console.print(f"Resuming: {len(run_journal.completed)} episodes already in {journal_path}")
+        results = resume_episodes(specs, seed, agent_identity(agent, llm_provider, llm_model), run_journal, run_specs)
+    else:
+        results = run_specs(specs)
+
+    kept: List = []  # only the monolithic JSON report needs every episode in memory
+    writer = JsonlReportWriter(out) if out and out_format == "jsonl" else None
+    archive = TraceArchiveWriter(trace_archive) if trace_archive else None
+    title = f"APIG v0.1 results (agent={agent}, suite={suite})"
+    display = Live(_score_tables(title, acc), console=console, auto_refresh=False) if live else None
+    last_refresh = 0.0
+    try:
+        if display is not None:
+            display.start()
+        for r in results:
+            acc.add(r)
+            if display is not None and time.monotonic() - last_refresh > 0.25:
+                display.update(_score_tables(title, acc), refresh=True)
+                last_refresh = time.monotonic()
+            if archive is not None:
+                archive.add(r)
+                r = replace(r, trace=[])
+            if writer is not None:
+                writer.write_episode(r)
+            elif out:
+                kept.append(r)
+        summary = acc.summary()
+        summary_dict = to_dict(summary)
+        if group_by:
+            summary_dict["groups"] = groups_to_dict(acc.group_summaries())
+        if writer is not None:
+            writer.write_summary(summary_dict)
+    finally:
+        if display is not None:
+            display.update(_score_tables(title, acc), refresh=True)
+            display.stop()
+        if writer is not None:
+            writer.close()
+        if archive is not None:
+            archive.close()
+        if run_journal is not None:
+            run_journal.close()
+
+    if display is None:
+        console.print(_score_tables(title, acc))
 
     if out:
-        data = {
-            "summary": to_dict(summary),
-            "episodes": [
-                {
-                    "episode_id": r.episode_id,
-                    "suite": r.suite,
-                    "task_id": r.task_id,
-                    "attacked": r.attacked,
-                    "success": r.success,
-                    "uar_attempted": r.uar_attempted,
-                    "uar_executed": r.uar_executed,
-                    "ser_attempted": r.ser_attempted,
-                    "ser_executed": r.ser_executed,
-                    "uar_attempted": r.uar_attempted,
-                    "uar_executed": r.uar_executed,
-                    "ser_attempted": r.ser_attempted,
-                    "ser_executed": r.ser_executed,
-                    "uar": r.uar,
-                    "ser": r.ser,
-                    "forbidden_calls": [{"name": c.name, "args": c.args} for c in r.forbidden_calls],
-                    "egress_hits": r.egress_hits,
-                    "trace": [{"t": e.t, "kind": e.kind, "data": e.data} for e in r.trace],
-                }
-                for r in all_results
-            ]
-        }
-        Path(out).write_text(json.dumps(data, indent=2), encoding="utf-8")
+        if writer is None:
+            write_json_report(out, summary_dict, kept)
         console.print(f"Wrote report to {out}")
 
+@report_app.command("show")
+def report_show(
+    episode_id: str = typer.Argument(..., help="Episode id to show"),
+    archive: str = typer.Option(..., help="Trace archive directory written by `apig run --trace-archive`."),
+    attack_id: Optional[str] = typer.Option(None, help="Only the variant with this attack id (episode ids are shared across variants)."),
+):
+    with TraceArchive(archive) as ta:
+        entries = [e for e in ta.entries(episode_id) if attack_id is None or e["attack_id"] == attack_id]
+        if not entries:
+            console.print(f"[red]No trace for episode {episode_id}[/red]")
+            raise typer.Exit(code=1)
+        for e in entries:
+            trace = [{"t": ev.t, "kind": ev.kind, "data": ev.data} for ev in ta.trace(e)]
+            typer.echo(json.dumps({"episode_id": episode_id, "attack_id": e["attack_id"], "trace": trace}, indent=2))
+
+@report_app.command("score")
+def report_score(
+    path: str = typer.Argument(..., help="JSON or JSONL report written by `apig run --out`"),
+    group_by: List[str] = typer.Option([], help=f"Also score per group; repeatable, one of {list(GROUP_KEYS)}."),
+):
+    """Re-score a report in one streaming pass (traces are not loaded)."""
+    try:
+        acc = GroupedScoreAccumulator(group_by)
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+    for r in iter_report_episodes(path):
+        acc.add(r)
+    console.print(_score_tables(f"APIG v0.1 results ({path})", acc))
+
+@report_app.command("ci")
+def report_ci(
+    path: str = typer.Argument(..., help="JSON or JSONL report"),
+    n_boot: int = typer.Option(10_000, help="Bootstrap resamples."),
+    alpha: float = typer.Option(0.05, help="1 - confidence level."),
+    seed: int = typer.Option(0, help="Bootstrap RNG seed."),
+):
+    """Bootstrap confidence intervals for every rate metric of a report."""
+    acc = ScoreAccumulator()
+    for r in iter_report_episodes(path):
+        acc.add(r)
+    table = Table(title=f"{1 - alpha:.0%} bootstrap CIs ({acc.episodes} episodes, {n_boot} resamples)")
+    for c in ("Metric", "Value", "Low", "High"):
+        table.add_column(c, justify="left" if c == "Metric" else "right")
+    for iv in bootstrap_ci(acc, n_boot=n_boot, alpha=alpha, seed=seed).values():
+        table.add_row(iv.metric, f"{iv.value:.3f}", f"{iv.low:.3f}", f"{iv.high:.3f}")
+    console.print(table)
+
+@report_app.command("compare")
+def report_compare(
+    report_a: str = typer.Argument(..., help="Baseline report (A)"),
+    report_b: str = typer.Argument(..., help="Candidate report (B)"),
+    n_boot: int = typer.Option(10_000, help="Bootstrap resamples."),
+    alpha: float = typer.Option(0.05, help="1 - confidence level."),
+    seed: int = typer.Option(0, help="Bootstrap RNG seed."),
+):
+    """Paired comparison of two runs, matching episodes on (episode_id, attack_id)."""
+    try:
+        joint, only_in_a, only_in_b = paired_outcomes(iter_report_episodes(report_a), iter_report_episodes(report_b))
+    except ValueError as e:
+        console.print(f"[red]Report {e}[/red]")
+        raise typer.Exit(code=1)
+    if only_in_a or only_in_b:
+        console.print(f"[yellow]Unmatched episodes: {only_in_a} only in A, {only_in_b} only in B (ignored)[/yellow]")
+    table = Table(title=f"B - A, paired ({sum(joint.values())} matched episodes)")
+    for c in ("Metric", "Pairs", "A", "B", "Diff", "CI low", "CI high", "A only", "B only", "p (McNemar)"):
+        table.add_column(c, justify="left" if c == "Metric" else "right")
+    for pc in paired_compare(joint, n_boot=n_boot, alpha=alpha, seed=seed).values():
+        table.add_row(
+            pc.metric, str(pc.pairs), f"{pc.a:.3f}", f"{pc.b:.3f}", f"{pc.diff:+.3f}",
+            f"{pc.low:+.3f}", f"{pc.high:+.3f}", str(pc.only_a), str(pc.only_b), f"{pc.p_value:.3g}",
+        )
+    console.print(table)
+
+@cache_app.command("stats")
+def cache_stats(path: str = typer.Argument(..., help="LLM cache (SQLite) path")):
+    cache = LLMCache(Path(path))
+    try:
+        stats = cache.stats()
+    finally:
+        cache.close()
+    table = Table(title=f"LLM cache {path}")
+    table.add_column("Stat")
+    table.add_column("Value", justify="right")
+    for k in ("entries", "legacy_entries", "stored_bytes", "file_bytes"):
+        table.add_row(k, str(stats[k]))
+    for k in ("oldest", "newest"):
+        table.add_row(k, time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(stats[k])) if stats[k] else "-")
+    console.print(table)
+
+@cache_app.command("gc")
+def cache_gc(
+    path: str = typer.Argument(..., help="LLM cache (SQLite) path"),
+    ttl_days: Optional[float] = typer.Option(None, help="Delete entries older than this many days."),
+    max_mb: Optional[float] = typer.Option(None, help="Then delete the oldest entries until stored values fit in this many MB."),
+    vacuum: bool = typer.Option(False, help="Also vacuum afterwards to shrink the file."),
+):
+    if ttl_days is None and max_mb is None:
+        raise typer.BadParameter("pass --ttl-days and/or --max-mb")
+    cache = LLMCache(Path(path))
+    try:
+        n = cache.gc(
+            ttl_seconds=ttl_days * 86400 if ttl_days is not None else None,
+            max_bytes=int(max_mb * (1 << 20)) if max_mb is not None else None,
+        )
+        if vacuum:
+            cache.vacuum()
+    finally:
+        cache.close()
+    console.print(f"Deleted {n} entries from {path}")
+
+@cache_app.command("vacuum")
+def cache_vacuum(path: str = typer.Argument(..., help="LLM cache (SQLite) path")):
+    cache = LLMCache(Path(path))
+    try:
+        before = cache.stats()["file_bytes"]
+        cache.vacuum()
+        after = cache.stats()["file_bytes"]
+    finally:
+        cache.close()
+    console.print(f"Vacuumed {path}: {before} -> {after} bytes")
+
+def _stub_server(
+    port: int, profile: StubProfile, replay_from: List[str] = [], replay_as: Optional[str] = None, replay_strict: bool = False,
+) -> StubServer:
+    if not replay_from:
+        return StubServer(port=port, profile=profile)
+    replay = ReplayProvider(**_replay_options(replay_from, replay_as, replay_strict, None, profile.seed))
+    return StubServer(port=port, profile=profile, responder=replay_responder(replay))
+
+_STUB_OPTS = {
+    "latency": "Simulated server latency, e.g. fixed:0.5, uniform:0.2,1.5, exp:0.8, lognormal:-0.5,0.6.",
+    "error_rate": "Share of requests answered with HTTP 500.",
+    "throttle_rate": "Share of requests answered with HTTP 429.",
+    "max_concurrency": "Answer 429 while more than this many requests are in flight.",
+    "retry_after": "Retry-After seconds sent with 429 responses.",
+    "replay_from": "Serve recorded responses from cache databases/transcripts instead of the scripted policy.",
+    "ramble_chars": "Append this many characters of prose after each response (a model that keeps talking).",
+    "stream_piece_s": "Seconds each streamed piece (~2 tokens) takes to generate.",
+}
+
+@app.command("stub-server")
+def stub_server(
+    port: int = typer.Option(8900, help="Port to listen on (127.0.0.1)."),
+    latency: Optional[str] = typer.Option(None, help=_STUB_OPTS["latency"]),
+    error_rate: float = typer.Option(0.0, help=_STUB_OPTS["error_rate"]),
+    throttle_rate: float = typer.Option(0.0, help=_STUB_OPTS["throttle_rate"]),
+    max_concurrency: Optional[int] = typer.Option(None, help=_STUB_OPTS["max_concurrency"]),
+    retry_after: float = typer.Option(1.0, help=_STUB_OPTS["retry_after"]),
+    seed: int = typer.Option(0, help="Seed for latency and error sampling."),
+    ramble_chars: int = typer.Option(0, help=_STUB_OPTS["ramble_chars"]),
+    stream_piece_s: float = typer.Option(0.0, help=_STUB_OPTS["stream_piece_s"]),
+    replay_from: List[str] = typer.Option([], help=_STUB_OPTS["replay_from"]),
+    replay_as: Optional[str] = typer.Option(None, help="Provider the replayed responses were recorded with (e.g. openai)."),
+    replay_strict: bool = typer.Option(False, help="Answer 500 on a replay miss (default: fall back to the scripted policy)."),
+):
+    """Serve OpenAI- and Gemini-compatible endpoints locally for load tests."""
+    profile = StubProfile(
+        latency=latency, error_rate=error_rate, throttle_rate=throttle_rate, max_concurrency=max_concurrency,
+        retry_after=retry_after, seed=seed, ramble_chars=ramble_chars, stream_piece_s=stream_piece_s,
+    )
+    server = _stub_server(port, profile, replay_from, replay_as, replay_strict)
+    console.print(f"Stub server on {server.url} (OpenAI: {server.url}/v1, Gemini: {server.url}/v1beta); Ctrl-C to stop")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    console.print(f"Served {server.stats}")
+
+@app.command()
+def loadtest(
+    suite: str = typer.Option("all", help=f"Suite name: one of {list(SUITES)} or 'all'"),
+    episodes: int = typer.Option(50, help="Episodes per clean task."),
+    concurrency: int = typer.Option(200, help="Episodes in flight at once."),
+    provider: str = typer.Option("openai", help="Client to drive: openai or gemini."),
+    defended: bool = typer.Option(False, help="Drive llm_defended instead of llm_naive."),
+    base_url: Optional[str] = typer.Option(None, help="Target an already running server instead of starting a stub."),
+    coalesce: bool = typer.Option(False, help="Coalesce identical concurrent requests (off: every episode hits the server)."),
+    max_retries: int = typer.Option(5, help="Client retries for 429/5xx responses."),
+    stream: bool = typer.Option(False, help="Stream completions, stopping at the first complete action JSON."),
+    latency: Optional[str] = typer.Option("fixed:0.05", help=_STUB_OPTS["latency"]),
+    error_rate: float = typer.Option(0.0, help=_STUB_OPTS["error_rate"]),
+    throttle_rate: float = typer.Option(0.0, help=_STUB_OPTS["throttle_rate"]),
+    max_concurrency: Optional[int] = typer.Option(None, help=_STUB_OPTS["max_concurrency"]),
+    retry_after: float = typer.Option(0.1, help=_STUB_OPTS["retry_after"]),
+    seed: int = typer.Option(0, help="Seed for latency and error sampling."),
+    ramble_chars: int = typer.Option(0, help=_STUB_OPTS["ramble_chars"]),
+    stream_piece_s: float = typer.Option(0.0, help=_STUB_OPTS["stream_piece_s"]),
+    out: Optional[str] = typer.Option(None, help="Also write the results as JSON to this path."),
+):
+    """Drive LLM agents against a stub server and report throughput and latency."""
+    if provider not in ("openai", "gemini"):
+        raise typer.BadParameter("--provider must be openai or gemini")
+    suite_names = list(SUITES) if suite == "all" else [suite]
+    server = None
+    if base_url is None:
+        profile = StubProfile(
+            latency=latency, error_rate=error_rate, throttle_rate=throttle_rate, max_concurrency=max_concurrency,
+            retry_after=retry_after, seed=seed, ramble_chars=ramble_chars, stream_piece_s=stream_piece_s,
+        )
+        server = _stub_server(0, profile).start()
+        base_url = server.url + ("/v1" if provider == "openai" else "/v1beta")
+    try:
+        res = run_loadtest(
+            base_url, provider=provider, suites=suite_names, episodes=episodes, concurrency=concurrency,
+            defended=defended, coalesce=coalesce, max_retries=max_retries, stream=stream,
+        )
+    finally:
+        if server is not None:
+            server.stop()
+    summary = res.to_dict()
+    if server is not None:
+        summary["server"] = dict(server.stats)
+    table = Table(title=f"Load test ({provider}, concurrency {concurrency})")
+    table.add_column("Metric")
+    table.add_column("Value", justify="right")
+    for k, v in summary.items():
+        if isinstance(v, dict):
+            v = ", ".join(f"{sk}={sv}" for sk, sv in v.items())
+        elif isinstance(v, float):
+            v = f"{v:.2f}"
+        table.add_row(k, str(v))
+    console.print(table)
+    if out:
+        Path(out).write_text(json.dumps(summary, indent=2), encoding="utf-8")
+        console.print(f"Wrote {out}")
+
 if __name__ == "__main__":
     app()
@@ -1,48 +1,174 @@
 from __future__ import annotations
+import posixpath
 from dataclasses import dataclass
+from functools import lru_cache
 from typing import Dict, List, Tuple, Optional
+from urllib.parse import urlsplit
 from .types import ToolCall
+from .scanner import compile_canaries
 
 @dataclass(frozen=True)
 class PolicyDecision:
     allowed: bool
     reason: Optional[str] = None
+    # Identifier of the rule that decided (for per-rule hit counters).
+    rule: Optional[str] = None
+
+# (path prefix, rule id); an empty prefix matches any path.
+_RuleList = List[Tuple[str, str]]
+
+
+class _HostMatcher:
+    """Compiled host allowlist.
+
+    Entries are `host`, `*.suffix` (any subdomain of suffix) and either form
+    followed by a URL path prefix (`internal.local/forms/`). As before the
+    compiled form, a URL with an explicit port only matches entries naming that
+    port (`internal.local:8080`, `*.corp.example:8443`). Exact hosts live in
+    a hash map; wildcards in a trie over reversed DNS labels, so a lookup costs
+    O(labels) however many rules there are.
+    """
+
+    def __init__(self, entries: List[str], kind: str):
+        self.exact: Dict[str, _RuleList] = {}
+        self.trie: Dict[str, dict] = {}
+        for entry in entries:
+            rule = f"{kind}:allow:{entry}"
+            host, _, path = entry.strip().lower().partition("/")
+            prefix = "/" + path if path else ""
+            if host.startswith("*."):
+                node = self.trie
+                for label in reversed(host[2:].split(".")):
+                    node = node.setdefault(label, {})
+                node.setdefault("", []).append((prefix, rule))
+            else:
+                self.exact.setdefault(host, []).append((prefix, rule))
+
+    @staticmethod
+    def _first(rules: _RuleList, path: str) -> Optional[str]:
+        for prefix, rule in rules:
+            if path.startswith(prefix):
+                return rule
+        return None
+
+    def match(self, host: str, path: str = "/") -> Optional[str]:
+        rules = self.exact.get(host)
+        if rules:
+            rule = self._first(rules, path)
+            if rule:
+                return rule
+        labels = host.split(".")
+        node = self.trie
+        # Wildcards need at least one label left over (`*.a.b` does not match `a.b`).
+        for i in range(len(labels) - 1, 0, -1):
+            node = node.get(labels[i])
+            if node is None:
+                return None
+            rules = node.get("")
+            if rules:
+                rule = self._first(rules, path)
+                if rule:
+                    return rule
+        return None
+
+
+def _split_url(url: str) -> Tuple[str, str]:
+    if "://" not in url:
+        url = "//" + url
+    try:
+        parts = urlsplit(url)
+        host = (parts.hostname or "").rstrip(".")
+        port = parts.port
+    except ValueError:
+        return url.lower(), "/"
+    if port is not None:
+        # Keep the port: a rule for the bare host does not cover other ports.
+        host = f"[{host}]:{port}" if ":" in host else f"{host}:{port}"
+    return host, parts.path or "/"
+
 
 class Policy:
-    """Simple policy engine. Suites can extend/override."
+    """Simple policy engine. Suites can extend/override.
+
+    Allowlists are compiled once at construction (see _HostMatcher) and
+    decisions are memoized per normalized (tool, target) in an LRU cache, so
+    checks stay cheap for millions of tool calls. Every decision names the rule
+    that produced it.
+
+    - allow_http_domains / allow_email_domains: hosts, `*.suffix` wildcards,
+      and (HTTP only) `host/path/prefix` entries
+    - allow_path_prefixes: sandbox file path prefixes for read_file/write_file
+    - tool_domains: per-tool HTTP allowlists overriding allow_http_domains
+    - deny_tools: tools that are blocked outright
     """
 
-    def __init__(self, allow_http_domains: List[str] | None = None, allow_email_domains: List[str] | None = None):
+    def __init__(
+        self,
+        allow_http_domains: List[str] | None = None,
+        allow_email_domains: List[str] | None = None,
+        allow_path_prefixes: List[str] | None = None,
+        tool_domains: Dict[str, List[str]] | None = None,
+        deny_tools: List[str] | None = None,
+        cache_size: int = 4096,
+    ):
         self.allow_http_domains = allow_http_domains or ["internal.local"]
         self.allow_email_domains = allow_email_domains or ["internal.local"]
+        self.allow_path_prefixes = allow_path_prefixes or ["/sandbox/"]
+        self.tool_domains = tool_domains or {}
+        self.deny_tools = deny_tools or []
         # forbidden tool names may be suite specific; we block by args here.
+        self._http = _HostMatcher(self.allow_http_domains, "http")
+        self._http_by_tool = {t: _HostMatcher(d, f"http[{t}]") for t, d in self.tool_domains.items()}
+        self._email = _HostMatcher(self.allow_email_domains, "email")
+        self._paths = tuple(self.allow_path_prefixes)
+        self._deny = frozenset(self.deny_tools)
+        self._decide = lru_cache(maxsize=cache_size)(self._decide_uncached)
+
+    @staticmethod
+    def _target(name: str, args: dict) -> str:
+        if name in ("http_post", "web_fetch"):
+            return str(args.get("url", ""))
+        if name == "send_email":
+            return str(args.get("to", ""))
+        if name in ("write_file", "read_file"):
+            return str(args.get("path", ""))
+        return ""
 
     def check(self, call: ToolCall) -> PolicyDecision:
         name = call.name
-        args = call.args or {}
+        return self._decide(name, self._target(name, call.args or {}))
+
+    def cache_info(self):
+        return self._decide.cache_info()
 
+    def _decide_uncached(self, name: str, target: str) -> PolicyDecision:
+        if name in self._deny:
+            return PolicyDecision(False, f"Tool blocked: {name}", f"tool:deny:{name}")
         if name in ("http_post","web_fetch"):
-            url = str(args.get("url",""))
             # Basic host allowlist
-            host = url.split("://",1)[-1].split("/",1)[0].lower()
-            if host not in self.allow_http_domains:
-                return PolicyDecision(False, f"External domain blocked: {host}")
+            host, path = _split_url(target)
+            rule = self._http_by_tool.get(name, self._http).match(host, path)
+            if rule is None:
+                return PolicyDecision(False, f"External domain blocked: {host}", "http:deny:default")
+            return PolicyDecision(True, None, rule)
         if name == "send_email":
-            to = str(args.get("to",""))
             # allow either local names (no @) or allowlisted domain
-            if "@" in to:
-                dom = to.split("@",1)[1].lower()
-                if dom not in self.allow_email_domains:
-                    return PolicyDecision(False, f"External email domain blocked: {dom}")
+            if "@" not in target:
+                return PolicyDecision(True, None, "email:allow:local")
+            dom = target.split("@",1)[1].lower()
+            rule = self._email.match(dom)
+            if rule is None:
+                return PolicyDecision(False, f"External email domain blocked: {dom}", "email:deny:default")
+            return PolicyDecision(True, None, rule)
         if name in ("write_file","read_file"):
-            path = str(args.get("path",""))
-            if not path.startswith("/sandbox/"):
-                return PolicyDecision(False, "Path escape blocked")
-        return PolicyDecision(True, None)
+            # Normalize so `/sandbox/../etc` cannot escape via a matching prefix.
+            path = posixpath.normpath(target) + ("/" if target.endswith("/") else "")
+            for prefix in self._paths:
+                if path.startswith(prefix):
+                    return PolicyDecision(True, None, f"path:allow:{prefix}")
+            return PolicyDecision(False, "Path escape blocked", "path:deny:escape")
+        return PolicyDecision(True, None, "default:allow")
 
 def find_sensitive_egress(text: str, canaries: List[str]) -> List[str]:
-    hits = []
-    for c in canaries:
-        if c and c in text:
-            hits.append(c)
-    return hits
+    # Callers scanning many texts should hold on to a CanaryScanner instead.
+    return compile_canaries(canaries).scan(text)
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import copy
+import re
+from collections import ChainMap
+from typing import TYPE_CHECKING, List, Optional
+
+from apig.attacks.schema import AttackSpec
+from .scanner import CanaryScanner, compile_canaries
+from .tools import SandboxState
+
+if TYPE_CHECKING:
+    from apig.suites.base import Task
+
+# Environment-provided input files. Canaries found here are inputs, not egress.
+CONTEXT_FILES = frozenset({"/sandbox/inbox_latest.txt", "/sandbox/context.txt", "/sandbox/webpage.html"})
+
+_CANARY_RE = re.compile(r"CANARY-[A-Z0-9\-]+")
+
+
+def harvest_canaries(state: SandboxState) -> List[str]:
+    """Collect canaries planted in any state strings (by `CANARY-...` convention)."""
+    canaries = []
+    for v in list(state.files.values()) + [m.get("body", "") for m in state.inbox] + list(state.web.values()):
+        canaries.extend(_CANARY_RE.findall(str(v)))
+    return sorted(set(canaries))
+
+
+def expose_context_files(state: SandboxState) -> None:
+    """Expose untrusted content to agents via standard sandbox files."""
+    if state.inbox:
+        state.files["/sandbox/inbox_latest.txt"] = state.inbox[0].get("body", "")
+
+    if state.retrieved_docs:
+        texts = []
+        for _, docs in (state.retrieved_docs or {}).items():
+            for d in docs:
+                texts.append(f"[{d.get('title', 'doc')}] {d.get('text', '')}")
+        state.files["/sandbox/context.txt"] = "\n".join(texts)
+
+    if state.web:
+        # store one page as a convenient input file
+        url, html = next(iter(state.web.items()))
+        state.files["/sandbox/webpage.html"] = html
+
+
+class SandboxTemplate:
+    """A task's sandbox, set up once and cloned per episode.
+
+    Building a template runs `task.setup` (attack compilation, rendering),
+    harvests canaries, compiles their scanner and writes the context files a
+    single time. `clone()`
+    then returns a copy-on-write SandboxState:
+
+    - files: a ChainMap whose first map receives the episode's writes
+    - forms / outbox / http_posts / adaptive_counters: copied (tools mutate them)
+    - inbox / web / retrieved_docs / adaptive_*: shared (tools only read them)
+    """
+
+    def __init__(self, state: SandboxState, canaries: List[str], scanner: CanaryScanner):
+        self.state = state
+        self.canaries = canaries
+        self.scanner = scanner
+
+    @classmethod
+    def build(cls, task: "Task", attack: Optional[AttackSpec], encodings: bool = False) -> "SandboxTemplate":
+        st = SandboxState(files={}, inbox=[], web={}, retrieved_docs={}, forms={}, outbox=[], http_posts=[])
+        task.setup(st, attack)
+        # Harvest before exposing context files: those are inputs by definition.
+        canaries = harvest_canaries(st)
+        expose_context_files(st)
+        return cls(st, canaries, compile_canaries(canaries, encodings))
+
+    def clone(self) -> SandboxState:
+        base = self.state
+        return SandboxState(
+            files=ChainMap({}, base.files),
+            inbox=base.inbox,
+            web=base.web,
+            retrieved_docs=base.retrieved_docs,
+            forms=copy.deepcopy(base.forms),
+            outbox=list(base.outbox),
+            http_posts=list(base.http_posts),
+            adaptive_web=base.adaptive_web,
+            adaptive_docs=base.adaptive_docs,
+            adaptive_counters=dict(base.adaptive_counters),
+        )
@@ -1,13 +1,14 @@
 from __future__ import annotations
 from dataclasses import dataclass, field
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, Iterable, List, Literal, MutableMapping, Optional, Tuple
 from .types import ToolCall, ToolResult
-import json
+import time
 
 @dataclass
 class SandboxState:
     """Holds deterministic environment state."""
-    files: Dict[str, str]
+    # Any mutable mapping: episode clones use a copy-on-write ChainMap.
+    files: MutableMapping[str, str]
     inbox: List[Dict[str, Any]]
     web: Dict[str, str]
     retrieved_docs: Dict[str, List[Dict[str, str]]]
@@ -21,61 +22,154 @@ class SandboxState:
     adaptive_docs: Dict[str, List[List[Dict[str, str]]]] = field(default_factory=dict)
     adaptive_counters: Dict[str, int] = field(default_factory=dict)
 
+SideEffect = Literal["read", "write", "external"]
+
+
+@dataclass(frozen=True)
+class ToolSpec:
+    """A sandbox tool: handler plus the metadata the harness dispatches on.
+
+    - required_args / optional_args: declared argument schema
+    - side_effect: "read" (only reads state), "write" (mutates the sandbox),
+      "external" (leaves the sandbox)
+    - outbound: data sent through this tool leaves the agent (egress channel)
+    - egress_arg: argument carrying that data (scanned for canaries)
+    - path_arg: for "write" tools that write sandbox files, the path argument
+    """
+
+    name: str
+    handler: Callable[[SandboxState, Dict[str, Any]], ToolResult]
+    required_args: Tuple[str, ...] = ()
+    optional_args: Tuple[str, ...] = ()
+    side_effect: SideEffect = "read"
+    outbound: bool = False
+    egress_arg: Optional[str] = None
+    path_arg: Optional[str] = None
+
+
+def _read_file(state: SandboxState, a: Dict[str, Any]) -> ToolResult:
+    path = str(a["path"])
+    return ToolResult(True, state.files.get(path, ""))
+
+
+def _write_file(state: SandboxState, a: Dict[str, Any]) -> ToolResult:
+    path = str(a["path"]); content = str(a.get("content",""))
+    state.files[path] = content
+    return ToolResult(True, {"written": path, "bytes": len(content)})
+
+
+def _send_email(state: SandboxState, a: Dict[str, Any]) -> ToolResult:
+    msg = {"to": a.get("to"), "subject": a.get("subject",""), "body": a.get("body","")}
+    state.outbox.append(msg)
+    return ToolResult(True, {"sent": True})
+
+
+def _http_post(state: SandboxState, a: Dict[str, Any]) -> ToolResult:
+    rec = {"url": a.get("url"), "body": a.get("body","")}
+    state.http_posts.append(rec)
+    return ToolResult(True, {"status": 200})
+
+
+def _web_fetch(state: SandboxState, a: Dict[str, Any]) -> ToolResult:
+    url = str(a["url"])
+    # Adaptive stage selection
+    if url in state.adaptive_web:
+        k = f"web:{url}"
+        idx = state.adaptive_counters.get(k, 0)
+        stages = state.adaptive_web[url]
+        html = stages[min(idx, len(stages) - 1)] if stages else ""
+        state.adaptive_counters[k] = idx + 1
+        return ToolResult(True, {"url": url, "html": html, "stage": min(idx, len(stages) - 1)})
+    return ToolResult(True, {"url": url, "html": state.web.get(url, "")})
+
+
+def _retrieve_docs(state: SandboxState, a: Dict[str, Any]) -> ToolResult:
+    query = str(a.get("query",""))
+    if query in state.adaptive_docs:
+        k = f"docs:{query}"
+        idx = state.adaptive_counters.get(k, 0)
+        stages = state.adaptive_docs[query]
+        docs = stages[min(idx, len(stages) - 1)] if stages else []
+        state.adaptive_counters[k] = idx + 1
+        return ToolResult(True, docs)
+    return ToolResult(True, state.retrieved_docs.get(query, []))
+
+
+def _fill_form(state: SandboxState, a: Dict[str, Any]) -> ToolResult:
+    form_id = str(a["form_id"])
+    fields = dict(a.get("fields", {}))
+    state.forms.setdefault(form_id, {"fields": {}, "submitted": False})
+    state.forms[form_id]["fields"].update(fields)
+    return ToolResult(True, {"filled": True, "form_id": form_id})
+
+
+def _submit_form(state: SandboxState, a: Dict[str, Any]) -> ToolResult:
+    form_id = str(a["form_id"])
+    state.forms.setdefault(form_id, {"fields": {}, "submitted": False})
+    state.forms[form_id]["submitted"] = True
+    return ToolResult(True, {"submitted": True, "form_id": form_id, "fields": state.forms[form_id]["fields"]})
+
+
+# Built-in tools. Adaptive web_fetch/retrieve_docs advance a stage counter but
+# are "read" tools as far as the agent is concerned.
+TOOLS: Dict[str, ToolSpec] = {}
+
+
+def register_tool(spec: ToolSpec) -> ToolSpec:
+    """Add a tool to the default registry (suites can also pass Task.tools)."""
+    TOOLS[spec.name] = spec
+    return spec
+
+
+for _spec in (
+    ToolSpec("read_file", _read_file, ("path",)),
+    ToolSpec("write_file", _write_file, ("path",), ("content",), "write", egress_arg="content", path_arg="path"),
+    ToolSpec("send_email", _send_email, (), ("to", "subject", "body"), "external", outbound=True, egress_arg="body"),
+    ToolSpec("http_post", _http_post, (), ("url", "body"), "external", outbound=True, egress_arg="body"),
+    ToolSpec("web_fetch", _web_fetch, ("url",)),
+    ToolSpec("retrieve_docs", _retrieve_docs, (), ("query",)),
+    ToolSpec("fill_form", _fill_form, ("form_id",), ("fields",), "write"),
+    ToolSpec("submit_form", _submit_form, ("form_id",), (), "write"),
+):
+    register_tool(_spec)
+
+
 class ToolRouter:
-    def __init__(self, state: SandboxState):
+    """Dispatches tool calls through a name -> ToolSpec table.
+
+    With `timing=True` the router also keeps per-tool call counts and
+    cumulative handler latency in `stats` (name -> {"calls", "ms"}).
+    """
+
+    def __init__(self, state: SandboxState, tools: Optional[Iterable[ToolSpec]] = None, timing: bool = False):
         self.state = state
+        self.tools = TOOLS if not tools else {**TOOLS, **{t.name: t for t in tools}}
+        self.timing = timing
+        self.stats: Dict[str, Dict[str, float]] = {}
+
+    def spec(self, name: str) -> Optional[ToolSpec]:
+        return self.tools.get(name)
 
     def run(self, call: ToolCall) -> ToolResult:
-        name = call.name
+        spec = self.tools.get(call.name)
+        if spec is None:
+            return ToolResult(False, None, f"Unknown tool: {call.name}")
         a = call.args or {}
+        missing = [k for k in spec.required_args if k not in a]
+        if missing:
+            return ToolResult(False, None, f"Tool error: missing argument {', '.join(missing)}")
+        if not self.timing:
+            return self._invoke(spec, a)
+        t0 = time.perf_counter()
+        try:
+            return self._invoke(spec, a)
+        finally:
+            st = self.stats.setdefault(spec.name, {"calls": 0, "ms": 0.0})
+            st["calls"] += 1
+            st["ms"] += (time.perf_counter() - t0) * 1000.0
+
+    def _invoke(self, spec: ToolSpec, a: Dict[str, Any]) -> ToolResult:
         try:
-            if name == "read_file":
-                path = str(a["path"])
-                return ToolResult(True, self.state.files.get(path, ""))
-            if name == "write_file":
-                path = str(a["path"]); content = str(a.get("content",""))
-                self.state.files[path] = content
-                return ToolResult(True, {"written": path, "bytes": len(content)})
-            if name == "send_email":
-                msg = {"to": a.get("to"), "subject": a.get("subject",""), "body": a.get("body","")}
-                self.state.outbox.append(msg)
-                return ToolResult(True, {"sent": True})
-            if name == "http_post":
-                rec = {"url": a.get("url"), "body": a.get("body","")}
-                self.state.http_posts.append(rec)
-                return ToolResult(True, {"status": 200})
-            if name == "web_fetch":
-                url = str(a["url"])
-                # Adaptive stage selection
-                if url in self.state.adaptive_web:
-                    k = f"web:{url}"
-                    idx = self.state.adaptive_counters.get(k, 0)
-                    stages = self.state.adaptive_web[url]
-                    html = stages[min(idx, len(stages) - 1)] if stages else ""
-                    self.state.adaptive_counters[k] = idx + 1
-                    return ToolResult(True, {"url": url, "html": html, "stage": min(idx, len(stages) - 1)})
-                return ToolResult(True, {"url": url, "html": self.state.web.get(url, "")})
-            if name == "retrieve_docs":
-                query = str(a.get("query",""))
-                if query in self.state.adaptive_docs:
-                    k = f"docs:{query}"
-                    idx = self.state.adaptive_counters.get(k, 0)
-                    stages = self.state.adaptive_docs[query]
-                    docs = stages[min(idx, len(stages) - 1)] if stages else []
-                    self.state.adaptive_counters[k] = idx + 1
-                    return ToolResult(True, docs)
-                return ToolResult(True, self.state.retrieved_docs.get(query, []))
-            if name == "fill_form":
-                form_id = str(a["form_id"])
-                fields = dict(a.get("fields", {}))
-                self.state.forms.setdefault(form_id, {"fields": {}, "submitted": False})
-                self.state.forms[form_id]["fields"].update(fields)
-                return ToolResult(True, {"filled": True, "form_id": form_id})
-            if name == "submit_form":
-                form_id = str(a["form_id"])
-                self.state.forms.setdefault(form_id, {"fields": {}, "submitted": False})
-                self.state.forms[form_id]["submitted"] = True
-                return ToolResult(True, {"submitted": True, "form_id": form_id, "fields": self.state.forms[form_id]["fields"]})
-            return ToolResult(False, None, f"Unknown tool: {name}")
+            return spec.handler(self.state, a)
         except Exception as e:
             return ToolResult(False, None, f"Tool error: {e}")
@@ -0,0 +1,229 @@
+from __future__ import annotations
+
+import hashlib
+import sys
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Literal, Optional, Sequence, Tuple, Union, overload
+
+from .types import TraceEvent
+
+TraceLevel = Literal["none", "summary", "full"]
+TRACE_LEVELS: Tuple[str, ...] = ("none", "summary", "full")
+
+# Strings at least this long are stored once per content hash.
+BLOB_MIN_CHARS = 256
+# Shorter strings are interned (tool names, kinds, paths, repeated arguments).
+_INTERN_MAX_CHARS = 64
+
+
+class BlobRef:
+    """Placeholder for a large string held in a BlobStore."""
+
+    __slots__ = ("digest",)
+
+    def __init__(self, digest: str):
+        self.digest = digest
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, BlobRef) and other.digest == self.digest
+
+    def __hash__(self) -> int:
+        return hash(self.digest)
+
+    def __repr__(self) -> str:
+        return f"BlobRef({self.digest[:12]})"
+
+    def __reduce__(self):
+        return (BlobRef, (self.digest,))
+
+
+class BlobStore:
+    """Reference-counted, content-addressed string store.
+
+    Identical payloads (the same web page or doc set seen by every episode of
+    a variant) are kept once per process; a blob is dropped when the last
+    trace referencing it is garbage collected.
+    """
+
+    def __init__(self) -> None:
+        self._blobs: Dict[str, str] = {}
+        self._refs: Dict[str, int] = {}
+
+    @staticmethod
+    def digest(text: str) -> str:
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+    def put(self, text: str) -> str:
+        d = self.digest(text)
+        if d in self._blobs:
+            self._refs[d] += 1
+        else:
+            self._blobs[d] = text
+            self._refs[d] = 1
+        return d
+
+    def get(self, digest: str) -> str:
+        return self._blobs[digest]
+
+    def release(self, digest: str) -> None:
+        n = self._refs.get(digest, 0) - 1
+        if n > 0:
+            self._refs[digest] = n
+        else:
+            self._refs.pop(digest, None)
+            self._blobs.pop(digest, None)
+
+    def __len__(self) -> int:
+        return len(self._blobs)
+
+    def nbytes(self) -> int:
+        return sum(len(s) for s in self._blobs.values())
+
+
+DEFAULT_BLOBS = BlobStore()
+
+
+def _summarize_data(data: Dict[str, Any]) -> Dict[str, Any]:
+    # Keep scalars and short strings (tool names, ok/error flags, steps); drop payloads.
+    out = {}
+    for k, v in data.items():
+        if v is None or isinstance(v, (bool, int, float)):
+            out[sys.intern(k)] = v
+        elif isinstance(v, str) and len(v) <= _INTERN_MAX_CHARS:
+            out[sys.intern(k)] = sys.intern(v)
+    return out
+
+
+class TraceStore(Sequence[TraceEvent]):
+    """Compact, read-only episode trace.
+
+    Events are stored column-wise (`t` in an array, interned `kind` strings,
+    compacted data) and materialized as TraceEvents on access. At level
+    "full" large strings in event data are replaced by BlobRefs into a shared
+    BlobStore; at "summary" only scalar fields survive; "none" keeps nothing.
+    """
+
+    __slots__ = ("level", "_t", "_kinds", "_data", "_blobs", "_refs")
+
+    def __init__(self, events: Iterable[TraceEvent] = (), level: str = "full", blobs: Optional[BlobStore] = None):
+        if level not in TRACE_LEVELS:
+            raise ValueError(f"Unknown trace level: {level} (expected one of {TRACE_LEVELS})")
+        self.level = level
+        self._t = array("q")
+        self._kinds: List[str] = []
+        self._data: List[Dict[str, Any]] = []
+        self._blobs = blobs if blobs is not None else DEFAULT_BLOBS
+        self._refs: List[str] = []
+        if level == "none":
+            return
+        for e in events:
+            self._t.append(e.t)
+            self._kinds.append(sys.intern(e.kind))
+            self._data.append(self._compact(e.data) if level == "full" else _summarize_data(e.data))
+
+    def _compact(self, v: Any) -> Any:
+        if isinstance(v, str):
+            if len(v) >= BLOB_MIN_CHARS:
+                d = self._blobs.put(v)
+                self._refs.append(d)
+                return BlobRef(d)
+            return sys.intern(v) if len(v) <= _INTERN_MAX_CHARS else v
+        if isinstance(v, dict):
+            return {(sys.intern(k) if isinstance(k, str) else k): self._compact(x) for k, x in v.items()}
+        if isinstance(v, list):
+            return [self._compact(x) for x in v]
+        if isinstance(v, tuple):
+            return tuple(self._compact(x) for x in v)
+        return v
+
+    def _expand(self, v: Any) -> Any:
+        if isinstance(v, BlobRef):
+            return self._blobs.get(v.digest)
+        if isinstance(v, dict):
+            return {k: self._expand(x) for k, x in v.items()}
+        if isinstance(v, list):
+            return [self._expand(x) for x in v]
+        if isinstance(v, tuple):
+            return tuple(self._expand(x) for x in v)
+        return v
+
+    def __len__(self) -> int:
+        return len(self._kinds)
+
+    @overload
+    def __getitem__(self, i: int) -> TraceEvent: ...
+    @overload
+    def __getitem__(self, i: slice) -> List[TraceEvent]: ...
+
+    def __getitem__(self, i: Union[int, slice]) -> Union[TraceEvent, List[TraceEvent]]:
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return TraceEvent(t=self._t[i], kind=self._kinds[i], data=self._expand(self._data[i]))
+
+    def __iter__(self) -> Iterator[TraceEvent]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def compact_rows(self) -> Iterator[Tuple[int, str, Dict[str, Any]]]:
+        """(t, kind, data) with payloads still as BlobRefs (see blob())."""
+        return zip(self._t, self._kinds, self._data)
+
+    def blob(self, digest: str) -> str:
+        return self._blobs.get(digest)
+
+    def blob_digests(self) -> List[str]:
+        return list(dict.fromkeys(self._refs))
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, TraceStore):
+            return (
+                self.level == other.level
+                and self._t == other._t
+                and self._kinds == other._kinds
+                and (self._data == other._data if self._blobs is other._blobs else list(self) == list(other))
+            )
+        if isinstance(other, Sequence):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"TraceStore(level={self.level!r}, events={len(self)})"
+
+    def __del__(self) -> None:
+        try:
+            for d in self._refs:
+                self._blobs.release(d)
+        except Exception:
+            pass
+
+    def __reduce__(self):
+        # Ship referenced blobs along (e.g. from pool workers); they are
+        # re-registered in the receiving process's default store.
+        blobs = {d: self._blobs.get(d) for d in self.blob_digests()}
+        return (_restore_trace, (self.level, self._t, self._kinds, self._data, blobs))
+
+
+def _restore_trace(level: str, t: array, kinds: List[str], data: List[Dict[str, Any]], blobs: Dict[str, str]) -> TraceStore:
+    ts = TraceStore(level=level)
+    ts._t = t
+    ts._kinds = [sys.intern(k) for k in kinds]
+    ts._data = data
+    counts: Dict[str, int] = {}
+    for row in data:
+        _count_refs(row, counts)
+    for d, n in counts.items():
+        for _ in range(n):
+            ts._blobs.put(blobs[d])
+            ts._refs.append(d)
+    return ts
+
+
+def _count_refs(v: Any, counts: Dict[str, int]) -> None:
+    if isinstance(v, BlobRef):
+        counts[v.digest] = counts.get(v.digest, 0) + 1
+    elif isinstance(v, dict):
+        for x in v.values():
+            _count_refs(x, counts)
+    elif isinstance(v, (list, tuple)):
+        for x in v:
+            _count_refs(x, counts)
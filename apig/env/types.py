@@ -1,12 +1,13 @@
 from __future__ import annotations
 from dataclasses import dataclass, field
-from typing import Any, Dict, List, Literal, Optional
+from typing import Any, Dict, List, Literal, Optional, Sequence
 
 ToolName = Literal["web_fetch","send_email","http_post","read_file","write_file","retrieve_docs","fill_form","submit_form"]
 
 @dataclass(frozen=True)
 class ToolCall:
-    name: ToolName
+    # A ToolName, or a tool registered via apig.env.tools.register_tool / Task.tools.
+    name: str
     args: Dict[str, Any]
 
 @dataclass(frozen=True)
@@ -41,4 +42,20 @@ class EpisodeResult:
     ser: bool
     forbidden_calls: List[ToolCall] = field(default_factory=list)
     egress_hits: List[str] = field(default_factory=list)
-    trace: List[TraceEvent] = field(default_factory=list)
+    # A list, or a compact apig.env.trace.TraceStore for harness-produced results.
+    trace: Sequence[TraceEvent] = field(default_factory=list)
+    # Attack variant (None for clean runs). Episode ids do not encode it.
+    attack_id: Optional[str] = None
+    # AttackSpec goal/channel/stealth, for grouped scoring.
+    attack_goal: Optional[str] = None
+    attack_channel: Optional[str] = None
+    attack_stealth: Optional[str] = None
+    # Tool-call index at which a canary first left (time-to-leak), and the
+    # bytes written per sandbox path.
+    first_leak_step: Optional[int] = None
+    files_written: Dict[str, int] = field(default_factory=dict)
+    # Policy rule id -> number of tool calls it decided.
+    policy_hits: Dict[str, int] = field(default_factory=dict)
+    # Totals of the agent's LLM steps (apig.llm.accounting.episode_usage):
+    # calls, cache hits, tokens, cost and latency. Empty for non-LLM agents.
+    llm_usage: Dict[str, float] = field(default_factory=dict)
@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import json
+import os
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Mapping, Optional, TextIO
+
+from apig.env.types import EpisodeResult
+from apig.report import episode_from_dict, episode_to_dict
+from apig.runner import EpisodeSpec
+
+
+def agent_identity(agent: str, llm_provider: Optional[str] = None, llm_model: Optional[str] = None) -> str:
+    """Who produced an episode. LLM agents are only comparable per provider/model."""
+    if llm_provider or llm_model:
+        return f"{agent}|{llm_provider}|{llm_model}"
+    return agent
+
+
+def journal_key(identity: str, episode_id: str, attack_id: Optional[str]) -> str:
+    # Episode ids are shared by every attack variant of a task, so the attack id
+    # is part of the key.
+    return f"{identity}:{episode_id}:{attack_id or '-'}"
+
+
+class RunJournal:
+    """Append-only record of finished episodes, used to resume crashed runs.
+
+    Each line is `{"key": ..., "episode": {...}}`. Appends are buffered and
+    fsync'd every `batch_size` episodes (and on close), so a crash loses at most
+    one batch. A torn final line from a crash is ignored on load.
+
+    Completed episodes are indexed by byte offset rather than held in memory.
+
+    `settings` (run options that change results, e.g. trace level or step
+    budgets) go in a `{"settings": {...}}` header line of a new journal; a
+    journal written under other settings is refused with ValueError, so a
+    resume never mixes episodes from differently configured runs.
+    """
+
+    def __init__(self, path: str, batch_size: int = 32, settings: Optional[Mapping[str, Any]] = None):
+        self.path = path
+        self.batch_size = batch_size
+        self.completed: Dict[str, int] = {}
+        self.settings: Optional[Dict[str, Any]] = None
+        self._buf: List[str] = []
+        self._load()
+        # Compared as stored (JSON round trip: tuples become lists, etc.).
+        wanted = json.loads(json.dumps(settings)) if settings is not None else None
+        if wanted is not None:
+            self._check_settings(wanted)
+        self._f: Optional[TextIO] = open(path, "a", encoding="utf-8")
+        self._rf: Optional[BinaryIO] = None
+        if wanted is not None and self.settings is None:
+            self.settings = wanted
+            self._buf.append(json.dumps({"settings": wanted}, sort_keys=True) + "\n")
+            self.flush()
+
+    def _check_settings(self, settings: Dict[str, Any]) -> None:
+        if self.settings is None:
+            if self.completed:
+                raise ValueError(f"journal {self.path} does not record its run settings; cannot check them for resuming")
+            return
+        diff = sorted(k for k in set(settings) | set(self.settings) if settings.get(k) != self.settings.get(k))
+        if diff:
+            was = ", ".join(f"{k}={self.settings.get(k)!r}" for k in diff)
+            now = ", ".join(f"{k}={settings.get(k)!r}" for k in diff)
+            raise ValueError(f"journal {self.path} was written with {was}, not {now}")
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        good_end = 0
+        with open(self.path, "rb") as f:
+            offset = 0
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    break
+                if "settings" in rec:
+                    self.settings = rec["settings"]
+                else:
+                    self.completed[rec["key"]] = offset
+                offset += len(line)
+                good_end = offset
+        # Drop a torn tail so new records start on a clean line.
+        if os.path.getsize(self.path) != good_end:
+            with open(self.path, "r+b") as f:
+                f.truncate(good_end)
+
+    def load_episode(self, key: str) -> EpisodeResult:
+        if self._rf is None:
+            self._rf = open(self.path, "rb")
+        self._rf.seek(self.completed[key])
+        return episode_from_dict(json.loads(self._rf.readline())["episode"])
+
+    def append(self, key: str, r: EpisodeResult) -> None:
+        self._buf.append(json.dumps({"key": key, "episode": episode_to_dict(r)}, ensure_ascii=False) + "\n")
+        if len(self._buf) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._buf or self._f is None:
+            return
+        self._f.write("".join(self._buf))
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._buf.clear()
+
+    def close(self) -> None:
+        if self._f is not None:
+            self.flush()
+            self._f.close()
+            self._f = None
+        if self._rf is not None:
+            self._rf.close()
+            self._rf = None
+
+    def __enter__(self) -> "RunJournal":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def resume_episodes(
+    specs: List[EpisodeSpec],
+    seed: int,
+    identity: str,
+    journal: RunJournal,
+    run: Callable[[List[EpisodeSpec]], Iterable[EpisodeResult]],
+) -> Iterator[EpisodeResult]:
+    """Yield results for `specs` in order, reusing journaled episodes.
+
+    Only episodes missing from the journal are passed to `run`; their results
+    are journaled as they arrive.
+    """
+    keys = [journal_key(identity, s.episode_id(seed), s.attack_id) for s in specs]
+    fresh = iter(run([s for s, k in zip(specs, keys) if k not in journal.completed]))
+    for k in keys:
+        if k in journal.completed:
+            yield journal.load_episode(k)
+        else:
+            r = next(fresh)
+            journal.append(k, r)
+            yield r
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, Iterable, Mapping, Optional, Tuple
+
+# USD per million (prompt, completion) tokens, at list prices. Keys match a
+# model id exactly or as its longest prefix (dated snapshots, -latest, ...).
+# Override or extend with load_prices(); unknown models are not costed.
+Price = Tuple[float, float]
+PRICES: Dict[str, Price] = {
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "o4-mini": (1.10, 4.40),
+    "gemini-1.5-pro": (1.25, 5.00),
+    "gemini-1.5-flash": (0.075, 0.30),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-2.5-pro": (1.25, 10.00),
+    "gemini-2.5-flash": (0.30, 2.50),
+}
+
+# Per-step fields LLMDrivenAgent adds to its llm_* trace events. All are
+# scalars, so they survive the "summary" trace level.
+STEP_FIELDS = ("prompt_tokens", "completion_tokens", "cached_prompt_tokens", "cost_usd", "latency_ms")
+LLM_EVENT_KINDS = frozenset({"llm_response", "llm_cached", "llm_repair"})
+
+
+def token_counts(usage: Optional[Mapping[str, Any]]) -> Tuple[int, int]:
+    """(prompt, completion) tokens from an OpenAI or Gemini usage block."""
+    if not usage:
+        return 0, 0
+    prompt = usage.get("prompt_tokens", usage.get("promptTokenCount", 0))
+    completion = usage.get("completion_tokens", usage.get("candidatesTokenCount", 0))
+    return int(prompt or 0), int(completion or 0)
+
+
+def cached_prompt_tokens(usage: Optional[Mapping[str, Any]]) -> int:
+    """Prompt tokens the provider served from its prompt cache (already
+    included in the prompt count; costed at the full price here)."""
+    if not usage:
+        return 0
+    details = usage.get("prompt_tokens_details") or {}
+    return int(details.get("cached_tokens") or usage.get("cachedContentTokenCount") or 0)
+
+
+def model_price(model: str, prices: Optional[Mapping[str, Price]] = None) -> Optional[Price]:
+    table = PRICES if prices is None else prices
+    if model in table:
+        return table[model]
+    best = max((k for k in table if model.startswith(k)), key=len, default=None)
+    return table[best] if best is not None else None
+
+
+def step_cost(model: str, prompt_tokens: int, completion_tokens: int, prices: Optional[Mapping[str, Price]] = None) -> Optional[float]:
+    price = model_price(model, prices)
+    if price is None:
+        return None
+    return (prompt_tokens * price[0] + completion_tokens * price[1]) / 1e6
+
+
+def load_prices(path: str) -> Dict[str, Price]:
+    """PRICES updated from a JSON file of {"model": [prompt_usd, completion_usd]} per 1M tokens."""
+    with open(path, encoding="utf-8") as f:
+        extra = json.load(f)
+    table = dict(PRICES)
+    for model, (p, c) in extra.items():
+        table[model] = (float(p), float(c))
+    return table
+
+
+def episode_usage(events: Iterable[Any]) -> Dict[str, float]:
+    """Totals over an agent trace's LLM steps; empty if it made none.
+
+    `calls` counts paid provider calls and `cache_hits` cached steps; steps
+    answered without a call of their own are counted by their `source`
+    ("replayed", "coalesced") instead. Cost and latency only cover the steps
+    that recorded them (paid calls; latency only with LLMConfig.timing).
+    """
+    out: Dict[str, float] = {}
+    for e in events:
+        if e.kind not in LLM_EVENT_KINDS:
+            continue
+        if not out:
+            out = {"calls": 0, "cache_hits": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        source = e.data.get("source")
+        counter = "cache_hits" if e.kind == "llm_cached" else source or "calls"
+        out[counter] = out.get(counter, 0) + 1
+        for k in STEP_FIELDS:
+            v = e.data.get(k)
+            if v is not None:
+                out[k] = out.get(k, 0) + v
+    return out
+
+
+def usage_summary(totals: Mapping[str, float], episodes: int) -> Dict[str, float]:
+    """Run totals plus per-episode and per-call means, for reports."""
+    out = dict(totals)
+    if episodes:
+        for k in ("prompt_tokens", "completion_tokens", "cost_usd"):
+            if k in totals:
+                out[f"{k}_per_episode"] = totals[k] / episodes
+    calls = totals.get("calls", 0)
+    if calls and "latency_ms" in totals:
+        out["latency_ms_per_call"] = totals["latency_ms"] / calls
+    return out
@@ -2,10 +2,17 @@ from __future__ import annotations
 
 import hashlib
 import json
+import queue
 import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple, Union
+
+from apig.llm.providers.base import LLMRequest
 
 
 def _hash_payload(payload: Dict[str, Any]) -> str:
@@ -14,6 +21,90 @@ def _hash_payload(payload: Dict[str, Any]) -> str:
     return hashlib.sha256(raw.encode("utf-8")).hexdigest()
 
 
+def request_payload(req: LLMRequest, provider: Optional[str] = None) -> Dict[str, Any]:
+    """Everything that determines a response; hashed for cache (and coalescing) keys.
+
+    `provider` overrides req.provider, e.g. to look up responses recorded
+    from another provider.
+    """
+    payload = {
+        "provider": provider or req.provider,
+        "model": req.model,
+        "system": req.system_prompt,
+        "user": req.user_prompt,
+        "temperature": req.temperature,
+        "top_p": req.top_p,
+        "max_output_tokens": req.max_output_tokens,
+    }
+    if req.messages is not None:
+        # The conversation's running digest stands in for the whole history.
+        del payload["user"]
+        payload["messages"] = req.messages.digest
+    return payload
+
+
+def request_key(req: LLMRequest, provider: Optional[str] = None) -> str:
+    return _hash_payload(request_payload(req, provider))
+
+
+_STOP = object()
+
+
+def _encode(value: Dict[str, Any]) -> Tuple[bytes, int]:
+    """(stored form, decoded JSON size) of a cache value."""
+    raw = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return zlib.compress(raw), len(raw)
+
+
+def _decode(stored: Union[bytes, str]) -> Tuple[Dict[str, Any], int]:
+    # Rows written before compression was introduced hold plain JSON text.
+    raw = stored.encode("utf-8") if isinstance(stored, str) else zlib.decompress(stored)
+    return json.loads(raw), len(raw)
+
+
+def _slim(value: Dict[str, Any]) -> Dict[str, Any]:
+    """Drop the provider's raw response, keeping its token usage if present."""
+    out = {k: v for k, v in value.items() if k != "raw"}
+    raw = value.get("raw")
+    if isinstance(raw, dict):
+        usage = raw.get("usage") or raw.get("usageMetadata")
+        if usage:
+            out["usage"] = usage
+    return out
+
+
+class _MemoryLRU:
+    """Decoded cache values, evicted least-recently-used past `max_bytes`
+    (measured as each value's JSON size, a cheap proxy for its weight)."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._items: "OrderedDict[str, Tuple[Dict[str, Any], int]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        item = self._items.get(key)
+        if item is None:
+            return None
+        self._items.move_to_end(key)
+        return item[0]
+
+    def put(self, key: str, value: Dict[str, Any], size: int) -> None:
+        if size > self.max_bytes:
+            return
+        old = self._items.pop(key, None)
+        if old is not None:
+            self.bytes -= old[1]
+        self._items[key] = (value, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, n) = self._items.popitem(last=False)
+            self.bytes -= n
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
 @dataclass
 class LLMCache:
     """SQLite-backed cache for LLM calls.
@@ -24,42 +115,256 @@ class LLMCache:
     - model
     - system + user messages
     - decoding parameters
+
+    Two tiers: an in-process LRU of decoded values (bounded by `memory_bytes`
+    of their JSON size) in front of SQLite, where values are stored zlib-compressed with their
+    creation time and size (see gc()). With `keep_raw=False` the provider's
+    raw response is not stored, only text and token usage.
+
+    The database runs in WAL mode, so readers never wait on writers and several
+    processes (e.g. `apig run --workers N`) can share one cache file. Writes
+    are queued and committed by a background thread in batched transactions;
+    until then `get` serves them from memory. Call `flush()` to wait for
+    queued writes and `close()` once at the end of the run. If the writer
+    fails to commit, `flush()`/`close()` re-raise its error and later `set()`
+    calls fail fast.
     """
 
     path: Path
+    batch_size: int = 64
+    flush_interval: float = 0.2
+    busy_timeout_ms: int = 30_000
+    memory_bytes: int = 64 << 20
+    keep_raw: bool = True
 
     def __post_init__(self) -> None:
         self.path.parent.mkdir(parents=True, exist_ok=True)
-        self._conn = sqlite3.connect(str(self.path))
-        self._conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS llm_cache (
-                k TEXT PRIMARY KEY,
-                v TEXT NOT NULL
+        self._conn = self._connect()
+        self._migrate()
+        self._lock = threading.Lock()
+        self._memory = _MemoryLRU(self.memory_bytes)
+        self._pending: Dict[str, bytes] = {}
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._writer_error: Optional[BaseException] = None
+        self._closed = False
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.path), timeout=self.busy_timeout_ms / 1000, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        return conn
+
+    def _migrate(self) -> None:
+        with self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    k TEXT PRIMARY KEY,
+                    v TEXT NOT NULL,
+                    created_at REAL,
+                    size INTEGER
+                )
+                """
+            )
+            cols = {row[1] for row in self._conn.execute("PRAGMA table_info(llm_cache)")}
+            for col, decl in (("created_at", "REAL"), ("size", "INTEGER")):
+                if col not in cols:
+                    try:
+                        self._conn.execute(f"ALTER TABLE llm_cache ADD COLUMN {col} {decl}")
+                    except sqlite3.OperationalError:
+                        pass  # added concurrently by another process
+            # Legacy rows: age them from now, size them as stored.
+            self._conn.execute(
+                "UPDATE llm_cache SET created_at=?, size=length(v) WHERE created_at IS NULL",
+                (time.time(),),
             )
-            """
-        )
-        self._conn.commit()
+            self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_created ON llm_cache (created_at)")
 
     def make_key(self, payload: Dict[str, Any]) -> str:
         return _hash_payload(payload)
 
     def get(self, key: str) -> Optional[Dict[str, Any]]:
-        cur = self._conn.execute("SELECT v FROM llm_cache WHERE k=?", (key,))
-        row = cur.fetchone()
-        if not row:
-            return None
-        return json.loads(row[0])
+        """Cached value for `key` (shared with the memory tier: do not mutate it)."""
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self.hits += 1
+                return value
+            stored: Union[bytes, str, None] = self._pending.get(key)
+            if stored is None:
+                row = self._conn.execute("SELECT v FROM llm_cache WHERE k=?", (key,)).fetchone()
+                stored = row[0] if row else None
+            if stored is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            value, size = _decode(stored)
+            self._memory.put(key, value, size)
+        return value
 
     def set(self, key: str, value: Dict[str, Any]) -> None:
-        self._conn.execute(
-            "INSERT OR REPLACE INTO llm_cache (k, v) VALUES (?, ?)",
-            (key, json.dumps(value, ensure_ascii=False)),
-        )
-        self._conn.commit()
+        if self._closed:
+            raise RuntimeError("LLMCache is closed")
+        self._raise_writer_error()
+        if not self.keep_raw:
+            value = _slim(value)
+        stored, size = _encode(value)
+        with self._lock:
+            self._pending[key] = stored
+            self._memory.put(key, value, size)
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write_behind, name="apig-llm-cache", daemon=True)
+            self._writer.start()
+        self._queue.put((key, stored))
+
+    def _write_behind(self) -> None:
+        try:
+            conn = self._connect()
+        except Exception as exc:
+            self._writer_error = exc
+            self._release_waiters()
+            return
+        try:
+            done = False
+            while not done:
+                item = self._queue.get()
+                batch: List[Tuple[str, bytes]] = []
+                waiters: List[threading.Event] = []
+                deadline = time.monotonic() + self.flush_interval
+                while True:
+                    if item is _STOP:
+                        done = True
+                    elif isinstance(item, threading.Event):
+                        waiters.append(item)
+                    else:
+                        batch.append(item)
+                    if done or waiters or len(batch) >= self.batch_size:
+                        break
+                    try:
+                        item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                try:
+                    if batch:
+                        self._commit(conn, batch)
+                except Exception as exc:
+                    self._writer_error = exc
+                    done = True
+                for w in waiters:
+                    w.set()
+        finally:
+            conn.close()
+        if self._writer_error is not None:
+            self._release_waiters()
+
+    def _release_waiters(self) -> None:
+        # Wake flush() calls queued behind a failed commit; anything queued
+        # later sees the thread gone (see flush()).
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, threading.Event):
+                item.set()
+
+    def _commit(self, conn: sqlite3.Connection, batch: List[Tuple[str, bytes]]) -> None:
+        now = time.time()
+        rows = [(k, sqlite3.Binary(v), now, len(v)) for k, v in batch]
+        for attempt in range(5):
+            try:
+                with conn:
+                    conn.executemany("INSERT OR REPLACE INTO llm_cache (k, v, created_at, size) VALUES (?, ?, ?, ?)", rows)
+                break
+            except sqlite3.OperationalError:
+                # Another process held the write lock past busy_timeout.
+                if attempt == 4:
+                    raise
+                time.sleep(0.05 * (attempt + 1))
+        with self._lock:
+            for k, v in batch:
+                if self._pending.get(k) is v:
+                    del self._pending[k]
+
+    def _raise_writer_error(self) -> None:
+        if self._writer_error is not None:
+            raise self._writer_error
+
+    def flush(self) -> None:
+        """Block until every queued write is committed; re-raises a failed commit."""
+        writer = self._writer
+        if writer is not None and writer.is_alive():
+            done = threading.Event()
+            self._queue.put(done)
+            while not done.wait(0.1):
+                if not writer.is_alive():
+                    break
+        self._raise_writer_error()
+
+    def stats(self) -> Dict[str, Any]:
+        self.flush()
+        with self._lock:
+            entries, stored, legacy, oldest, newest = self._conn.execute(
+                "SELECT count(*), coalesce(sum(size), 0), coalesce(sum(typeof(v) = 'text'), 0),"
+                " min(created_at), max(created_at) FROM llm_cache"
+            ).fetchone()
+        files = [self.path, Path(f"{self.path}-wal")]
+        return {
+            "entries": entries,
+            "stored_bytes": stored,
+            "legacy_entries": legacy,
+            "oldest": oldest,
+            "newest": newest,
+            "file_bytes": sum(f.stat().st_size for f in files if f.exists()),
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def gc(self, ttl_seconds: Optional[float] = None, max_bytes: Optional[int] = None) -> int:
+        """Delete entries older than `ttl_seconds`, then the oldest entries
+        until the stored size fits `max_bytes`. Returns the number deleted."""
+        self.flush()
+        deleted = 0
+        with self._lock, self._conn:
+            if ttl_seconds is not None:
+                cur = self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (time.time() - ttl_seconds,))
+                deleted += cur.rowcount
+            if max_bytes is not None:
+                total = self._conn.execute("SELECT coalesce(sum(size), 0) FROM llm_cache").fetchone()[0]
+                if total > max_bytes:
+                    doomed, freed = [], 0
+                    for k, size in self._conn.execute("SELECT k, size FROM llm_cache ORDER BY created_at, k"):
+                        if total - freed <= max_bytes:
+                            break
+                        doomed.append((k,))
+                        freed += size or 0
+                    self._conn.executemany("DELETE FROM llm_cache WHERE k=?", doomed)
+                    deleted += len(doomed)
+            self._memory = _MemoryLRU(self.memory_bytes)
+        return deleted
+
+    def vacuum(self) -> None:
+        """Reclaim space freed by gc() (rewrites the database file)."""
+        self.flush()
+        with self._lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._conn.execute("VACUUM")
 
     def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        if self._writer is not None:
+            self._queue.put(_STOP)
+            self._writer.join()
         try:
             self._conn.close()
         except Exception:
             pass
+        self._raise_writer_error()
@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+
+
+class ConcurrencyLimiter:
+    """Async cap on in-flight provider calls.
+
+    The cap adapts AIMD-style: it is halved when the provider throttles us
+    (at most once per `cooldown_s`) and grows back by about one slot per
+    round of successful calls, up to `limit`.
+
+    The underlying condition is bound lazily to the running event loop, so one
+    limiter can outlive the loop of a single run (e.g. across tests).
+    """
+
+    def __init__(self, limit: int, min_limit: int = 1, cooldown_s: float = 1.0):
+        if limit < 1:
+            raise ValueError("concurrency limit must be >= 1")
+        self.limit = limit
+        self.min_limit = max(1, min(min_limit, limit))
+        self.cooldown_s = cooldown_s
+        # Current (adaptive) cap; admission uses its integer part.
+        self.current = float(limit)
+        self._last_decrease = float("-inf")
+        self._in_flight = 0
+        self._cond: Optional[asyncio.Condition] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _condition(self) -> asyncio.Condition:
+        loop = asyncio.get_running_loop()
+        if self._cond is None or self._loop is not loop:
+            self._cond = asyncio.Condition()
+            self._loop = loop
+            self._in_flight = 0
+        return self._cond
+
+    def _has_room(self) -> bool:
+        return self._in_flight < int(self.current)
+
+    async def __aenter__(self) -> "ConcurrencyLimiter":
+        cond = self._condition()
+        async with cond:
+            await cond.wait_for(self._has_room)
+            self._in_flight += 1
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        cond = self._condition()
+        async with cond:
+            self._in_flight -= 1
+            cond.notify_all()
+
+    def on_success(self) -> None:
+        # Additive increase: +1 slot per `current` successes.
+        self.current = min(float(self.limit), self.current + 1.0 / self.current)
+
+    def on_throttle(self) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown_s:
+            return  # one decrease per burst of throttled responses
+        self._last_decrease = now
+        self.current = max(float(self.min_limit), self.current / 2)
+
+
+_LIMITERS: Dict[str, ConcurrencyLimiter] = {}
+
+
+def provider_limiter(provider: str, limit: int) -> ConcurrencyLimiter:
+    """Process-wide limiter shared by every agent using `provider`."""
+    key = provider.lower().strip()
+    lim = _LIMITERS.get(key)
+    if lim is None or lim.limit != limit:
+        lim = ConcurrencyLimiter(limit)
+        _LIMITERS[key] = lim
+    return lim
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at `per_minute` units per minute.
+
+    reserve() takes units immediately (the balance may go negative) and
+    returns how long the caller must wait before using them, so sync and
+    async callers can sleep in their own way.
+    """
+
+    def __init__(self, per_minute: float, burst: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        if per_minute <= 0:
+            raise ValueError("rate must be > 0")
+        self.rate = per_minute / 60.0
+        self.capacity = burst if burst is not None else per_minute
+        self._clock = clock
+        self._tokens = self.capacity
+        self._stamp = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def reserve(self, amount: float = 1.0) -> float:
+        with self._lock:
+            self._refill()
+            self._tokens -= amount
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def adjust(self, delta: float) -> None:
+        """Give back (positive) or charge (negative) units after the fact,
+        e.g. once the real token usage of a request is known."""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens + delta)
+
+
+_BUCKETS: Dict[Tuple[str, str], TokenBucket] = {}
+
+
+def provider_bucket(provider: str, kind: str, per_minute: float) -> TokenBucket:
+    """Process-wide bucket (`kind` = "requests" or "tokens") for `provider`."""
+    key = (provider.lower().strip(), kind)
+    bucket = _BUCKETS.get(key)
+    if bucket is None or bucket.rate != per_minute / 60.0:
+        bucket = _BUCKETS[key] = TokenBucket(per_minute)
+    return bucket
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """Exponential backoff with full jitter; a server's Retry-After wins."""
+
+    max_retries: int = 5
+    base_delay_s: float = 0.5
+    max_delay_s: float = 60.0
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None, rng: Optional[random.Random] = None) -> float:
+        if retry_after is not None:
+            return min(self.max_delay_s, max(0.0, retry_after))
+        return (rng or random).uniform(0.0, min(self.max_delay_s, self.base_delay_s * (2 ** attempt)))
@@ -1,7 +1,60 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import json
+import time
+from email.utils import parsedate_to_datetime
 from dataclasses import dataclass
-from typing import Dict, Any, Optional
+from typing import AsyncIterator, Callable, Dict, Any, Iterable, Iterator, List, Optional
+
+
+class Messages(tuple):
+    """Conversation after the system prompt: ({"role": "user"|"assistant",
+    "content": str}, ...), with `digest` identifying the whole sequence.
+
+    Built by MessageLog, so the digest never needs the history re-serialized.
+    """
+
+    digest: str
+
+    def __new__(cls, turns: Iterable[Dict[str, str]], digest: str) -> "Messages":
+        obj = super().__new__(cls, turns)
+        obj.digest = digest
+        return obj
+
+    def __reduce__(self):
+        return Messages, (tuple(self), self.digest)
+
+
+class MessageLog:
+    """Append-only conversation that hashes each turn once, when appended.
+
+    Turns are never rewritten, so every request built from the log shares
+    a byte-identical prefix with the previous one (which is what provider
+    prompt caching keys on).
+    """
+
+    def __init__(self) -> None:
+        self._turns: List[Dict[str, str]] = []
+        self._hash = hashlib.blake2b(digest_size=32)
+
+    def append(self, role: str, content: str) -> None:
+        self._turns.append({"role": role, "content": content})
+        self._hash.update(json.dumps([role, content], ensure_ascii=False).encode("utf-8") + b"\n")
+
+    def __len__(self) -> int:
+        return len(self._turns)
+
+    def snapshot(self) -> Messages:
+        return Messages(self._turns, self._hash.hexdigest())
+
+    @classmethod
+    def of(cls, turns: Iterable[Dict[str, str]]) -> Messages:
+        log = cls()
+        for t in turns:
+            log.append(t["role"], t["content"])
+        return log.snapshot()
 
 
 @dataclass
@@ -14,6 +67,9 @@ class LLMRequest:
     top_p: float = 1.0
     max_output_tokens: int = 512
     timeout_s: float = 60.0
+    # Multi-turn requests: the conversation after the system prompt, sent as
+    # separate messages. user_prompt is then its last (user) turn.
+    messages: Optional[Messages] = None
 
 
 @dataclass
@@ -21,10 +77,81 @@ class LLMResponse:
     text: str
     raw: Dict[str, Any]
     usage: Optional[Dict[str, Any]] = None
+    # Wall time of the call; set by LLMDrivenAgent when timing (providers leave it unset).
+    latency_ms: Optional[float] = None
+    # Set when no provider call was paid for this response: "replayed" (from a
+    # recording) or "coalesced" (shared with a concurrent identical request).
+    source: Optional[str] = None
+
+
+@dataclass
+class StreamEvent:
+    """One piece of a streamed completion: a text delta and/or, usually on
+    the last event, the token usage."""
+
+    text: str = ""
+    usage: Optional[Dict[str, Any]] = None
+
+
+# Fed each streamed text delta; returns the offset (in the whole text so far)
+# at which the completion is complete, or None to keep reading.
+StopCheck = Callable[[str], Optional[int]]
+
+
+def _streamed_response(req: LLMRequest, parts: List[str], usage: Optional[Dict[str, Any]], end: Optional[int]) -> LLMResponse:
+    text = "".join(parts)
+    if end is not None:
+        text = text[:end]
+        if usage is None:
+            # Providers report usage at the end of the stream, which was dropped;
+            # estimate ~4 characters per token instead.
+            prompt = sum(len(m["content"]) for m in req.messages) if req.messages is not None else len(req.user_prompt)
+            usage = {
+                "prompt_tokens": (len(req.system_prompt) + prompt) // 4,
+                "completion_tokens": len(text) // 4 + 1,
+                "estimated": True,
+            }
+    return LLMResponse(text=text, raw={"stream": {"stopped_early": end is not None}}, usage=usage)
+
+
+# Statuses worth retrying: timeouts, throttling and transient server errors.
+RETRYABLE_STATUS = frozenset({408, 409, 425, 429, 500, 502, 503, 504})
+THROTTLE_STATUS = frozenset({429, 503})
 
 
 class LLMProviderError(RuntimeError):
-    pass
+    """Provider failure. HTTP errors carry the status and any Retry-After delay."""
+
+    def __init__(
+        self,
+        message: str,
+        status_code: Optional[int] = None,
+        retry_after: Optional[float] = None,
+        retryable: Optional[bool] = None,
+    ):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.retryable = status_code in RETRYABLE_STATUS if retryable is None else retryable
+
+    @property
+    def throttled(self) -> bool:
+        return self.status_code in THROTTLE_STATUS
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
 
 
 class LLMProvider:
@@ -34,3 +161,62 @@ class LLMProvider:
 
     def generate(self, req: LLMRequest) -> LLMResponse:
         raise NotImplementedError
+
+    async def agenerate(self, req: LLMRequest) -> LLMResponse:
+        """Async variant of generate(). Clients with a native async transport
+        override this; the default runs the blocking call in a thread.
+        """
+        return await asyncio.to_thread(self.generate, req)
+
+    def stream(self, req: LLMRequest) -> Iterator[StreamEvent]:
+        """Completion as it is generated. Closing the iterator early cancels
+        the request. The default yields the whole generate() result at once.
+        """
+        resp = self.generate(req)
+        yield StreamEvent(text=resp.text, usage=resp.usage)
+
+    async def astream(self, req: LLMRequest) -> AsyncIterator[StreamEvent]:
+        resp = await self.agenerate(req)
+        yield StreamEvent(text=resp.text, usage=resp.usage)
+
+    def generate_until(self, req: LLMRequest, make_stop: Callable[[], StopCheck]) -> LLMResponse:
+        """Streams the completion until a fresh `make_stop()` check reports it
+        complete, then drops the rest. The text is cut at that point; usage is
+        estimated when the provider had not reported it yet.
+        """
+        stop, parts, usage, end = make_stop(), [], None, None
+        events = self.stream(req)
+        try:
+            for ev in events:
+                usage = ev.usage or usage
+                if ev.text:
+                    parts.append(ev.text)
+                    end = stop(ev.text)
+                    if end is not None:
+                        break
+        finally:
+            events.close()
+        return _streamed_response(req, parts, usage, end)
+
+    async def agenerate_until(self, req: LLMRequest, make_stop: Callable[[], StopCheck]) -> LLMResponse:
+        stop, parts, usage, end = make_stop(), [], None, None
+        events = self.astream(req)
+        try:
+            async for ev in events:
+                usage = ev.usage or usage
+                if ev.text:
+                    parts.append(ev.text)
+                    end = stop(ev.text)
+                    if end is not None:
+                        break
+        finally:
+            await events.aclose()
+        return _streamed_response(req, parts, usage, end)
+
+    def close(self) -> None:
+        """Release connections held across requests (called once per run)."""
+        pass
+
+    async def aclose(self) -> None:
+        """Async variant of close(), run on the loop that made async requests."""
+        self.close()
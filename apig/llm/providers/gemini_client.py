@@ -1,14 +1,16 @@
 from __future__ import annotations
 
+import json
 import os
-from typing import Dict, Any, Optional
+from typing import AsyncIterator, Dict, Any, Iterator, Optional
 
 import httpx
 
-from .base import LLMProvider, LLMRequest, LLMResponse, LLMProviderError
+from .base import LLMRequest, LLMResponse, LLMProviderError, StreamEvent, parse_retry_after
+from .http import HTTPOptions, HTTPProvider, asse_events, sse_events
 
 
-class GeminiClient(LLMProvider):
+class GeminiClient(HTTPProvider):
     """Minimal Gemini Generative Language API client via REST.
 
     Endpoint style (v1beta):
@@ -19,44 +21,125 @@ class GeminiClient(LLMProvider):
 
     name = "gemini"
 
-    def __init__(self, api_key: Optional[str] = None, base_url: str = "https://generativelanguage.googleapis.com/v1beta"):
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        http: Optional[HTTPOptions] = None,
+    ):
         self.api_key = api_key or os.environ.get("GEMINI_API_KEY")
         if not self.api_key:
             raise LLMProviderError("Missing Gemini API key (set GEMINI_API_KEY or pass api_key)")
-        self.base_url = base_url.rstrip("/")
-
-    def generate(self, req: LLMRequest) -> LLMResponse:
-        url = f"{self.base_url}/models/{req.model}:generateContent"
-        params = {"key": self.api_key}
+        super().__init__(base_url or "https://generativelanguage.googleapis.com/v1beta", http)
 
+    def _payload(self, req: LLMRequest) -> Dict[str, Any]:
         # Gemini uses a slightly different schema.
-        payload: Dict[str, Any] = {
+        config = {
+            "temperature": req.temperature,
+            "topP": req.top_p,
+            "maxOutputTokens": req.max_output_tokens,
+        }
+        if req.messages is not None:
+            # Multi-turn: a separate system instruction keeps the turns a stable prefix.
+            return {
+                "systemInstruction": {"parts": [{"text": req.system_prompt}]},
+                "contents": [
+                    {"role": "model" if m["role"] == "assistant" else "user", "parts": [{"text": m["content"]}]}
+                    for m in req.messages
+                ],
+                "generationConfig": config,
+            }
+        return {
             "contents": [
                 {
                     "role": "user",
                     "parts": [{"text": f"{req.system_prompt}\n\n{req.user_prompt}"}],
                 }
             ],
-            "generationConfig": {
-                "temperature": req.temperature,
-                "topP": req.top_p,
-                "maxOutputTokens": req.max_output_tokens,
-            },
+            "generationConfig": config,
         }
 
+    def _parse(self, r: httpx.Response) -> LLMResponse:
+        if r.status_code >= 400:
+            raise LLMProviderError(
+                f"Gemini HTTP {r.status_code}: {r.text[:300]}",
+                status_code=r.status_code,
+                retry_after=parse_retry_after(r.headers.get("retry-after")),
+            )
+        raw = r.json()
+        usage = raw.get("usageMetadata")
+        return LLMResponse(text=self._text(raw), raw=raw, usage=usage)
+
+    @staticmethod
+    def _text(raw: Dict[str, Any]) -> str:
+        # Extract text from first candidate
+        cand = (raw.get("candidates") or [{}])[0]
+        parts = ((cand.get("content") or {}).get("parts") or [])
+        return "".join([p.get("text", "") for p in parts])
+
+    def generate(self, req: LLMRequest) -> LLMResponse:
+        params = {"key": self.api_key}
+        try:
+            r = self.client().post(f"models/{req.model}:generateContent", params=params, json=self._payload(req), timeout=req.timeout_s)
+            return self._parse(r)
+        except httpx.RequestError as e:
+            raise LLMProviderError(f"Gemini request failed: {e}", retryable=True)
+        except LLMProviderError:
+            raise
+        except Exception as e:
+            raise LLMProviderError(f"Gemini parse failed: {e}")
+
+    async def agenerate(self, req: LLMRequest) -> LLMResponse:
+        params = {"key": self.api_key}
+        try:
+            r = await self.aclient().post(
+                f"models/{req.model}:generateContent", params=params, json=self._payload(req), timeout=req.timeout_s
+            )
+            return self._parse(r)
+        except httpx.RequestError as e:
+            raise LLMProviderError(f"Gemini request failed: {e}", retryable=True)
+        except LLMProviderError:
+            raise
+        except Exception as e:
+            raise LLMProviderError(f"Gemini parse failed: {e}")
+
+    def _stream_event(self, data: str) -> StreamEvent:
+        # Each event is a partial GenerateContentResponse; the last carries usage.
+        chunk = json.loads(data)
+        return StreamEvent(text=self._text(chunk), usage=chunk.get("usageMetadata"))
+
+    def stream(self, req: LLMRequest) -> Iterator[StreamEvent]:
+        params = {"key": self.api_key, "alt": "sse"}
+        try:
+            with self.client().stream(
+                "POST", f"models/{req.model}:streamGenerateContent", params=params, json=self._payload(req), timeout=req.timeout_s
+            ) as r:
+                if r.status_code >= 400:
+                    r.read()
+                    self._parse(r)
+                for data in sse_events(r.iter_lines()):
+                    yield self._stream_event(data)
+        except httpx.RequestError as e:
+            raise LLMProviderError(f"Gemini request failed: {e}", retryable=True)
+        except LLMProviderError:
+            raise
+        except Exception as e:
+            raise LLMProviderError(f"Gemini parse failed: {e}")
+
+    async def astream(self, req: LLMRequest) -> AsyncIterator[StreamEvent]:
+        params = {"key": self.api_key, "alt": "sse"}
         try:
-            with httpx.Client(timeout=req.timeout_s) as client:
-                r = client.post(url, params=params, json=payload)
-            if r.status_code >= 400:
-                raise LLMProviderError(f"Gemini HTTP {r.status_code}: {r.text[:300]}")
-            raw = r.json()
-            # Extract text from first candidate
-            cand = (raw.get("candidates") or [{}])[0]
-            parts = ((cand.get("content") or {}).get("parts") or [])
-            text = "".join([p.get("text", "") for p in parts])
-            usage = raw.get("usageMetadata")
-            return LLMResponse(text=text, raw=raw, usage=usage)
+            async with self.aclient().stream(
+                "POST", f"models/{req.model}:streamGenerateContent", params=params, json=self._payload(req), timeout=req.timeout_s
+            ) as r:
+                if r.status_code >= 400:
+                    await r.aread()
+                    self._parse(r)
+                async for data in asse_events(r.aiter_lines()):
+                    yield self._stream_event(data)
         except httpx.RequestError as e:
-            raise LLMProviderError(f"Gemini request failed: {e}")
+            raise LLMProviderError(f"Gemini request failed: {e}", retryable=True)
+        except LLMProviderError:
+            raise
         except Exception as e:
             raise LLMProviderError(f"Gemini parse failed: {e}")
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Iterator, Optional
+
+import httpx
+
+from .base import LLMProvider, LLMProviderError
+
+
+@dataclass(frozen=True)
+class HTTPOptions:
+    """Connection pool settings shared by the REST providers."""
+
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    # Needs the `h2` package (pip install 'httpx[http2]').
+    http2: bool = False
+
+
+def _sse_data(line: str) -> Optional[str]:
+    if not line.startswith("data:"):
+        return None  # blank separators, comments, event:/id: fields
+    data = line[5:].strip()
+    return None if data in ("", "[DONE]") else data
+
+
+def sse_events(lines: Iterator[str]) -> Iterator[str]:
+    """`data:` payloads of a server-sent event stream (one JSON document each
+    for the OpenAI and Gemini streaming APIs)."""
+    for line in lines:
+        data = _sse_data(line)
+        if data is not None:
+            yield data
+
+
+async def asse_events(lines: AsyncIterator[str]) -> AsyncIterator[str]:
+    async for line in lines:
+        data = _sse_data(line)
+        if data is not None:
+            yield data
+
+
+class HTTPProvider(LLMProvider):
+    """Base for REST providers: owns one pooled keep-alive client per run.
+
+    The sync client is created on first use. An AsyncClient is bound to the
+    event loop it was created on, so one is kept per running loop (a run
+    normally has exactly one). Both are closed by close()/aclose().
+    """
+
+    def __init__(self, base_url: str, options: Optional[HTTPOptions] = None):
+        self.base_url = base_url.rstrip("/")
+        self.http = options or HTTPOptions()
+        self._client: Optional[httpx.Client] = None
+        self._aclient: Optional[httpx.AsyncClient] = None
+        self._aclient_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _headers(self) -> Dict[str, str]:
+        return {"Content-Type": "application/json"}
+
+    def _client_kwargs(self) -> dict:
+        limits = httpx.Limits(
+            max_connections=self.http.max_connections,
+            max_keepalive_connections=self.http.max_keepalive_connections,
+            keepalive_expiry=self.http.keepalive_expiry,
+        )
+        # base_url needs a trailing slash for relative request paths to append to it.
+        return {"base_url": self.base_url + "/", "headers": self._headers(), "limits": limits, "http2": self.http.http2}
+
+    def client(self) -> httpx.Client:
+        if self._client is None:
+            try:
+                self._client = httpx.Client(**self._client_kwargs())
+            except ImportError as e:
+                raise LLMProviderError(f"HTTP/2 needs the h2 package: pip install 'httpx[http2]' ({e})")
+        return self._client
+
+    def aclient(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._aclient is None or self._aclient_loop is not loop:
+            # A client from a previous (now finished) loop cannot be reused.
+            try:
+                self._aclient = httpx.AsyncClient(**self._client_kwargs())
+            except ImportError as e:
+                raise LLMProviderError(f"HTTP/2 needs the h2 package: pip install 'httpx[http2]' ({e})")
+            self._aclient_loop = loop
+        return self._aclient
+
+    def close(self) -> None:
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    async def aclose(self) -> None:
+        if self._aclient is not None and self._aclient_loop is asyncio.get_running_loop():
+            await self._aclient.aclose()
+        self._aclient = None
+        self._aclient_loop = None
+        self.close()
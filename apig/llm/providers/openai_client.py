@@ -1,36 +1,44 @@
 from __future__ import annotations
 
+import json
 import os
-from typing import Dict, Any, Optional
+from typing import AsyncIterator, Dict, Any, Iterator, Optional
 
 import httpx
 
-from .base import LLMProvider, LLMRequest, LLMResponse, LLMProviderError
+from .base import LLMRequest, LLMResponse, LLMProviderError, StreamEvent, parse_retry_after
+from .http import HTTPOptions, HTTPProvider, asse_events, sse_events
 
 
-class OpenAIClient(LLMProvider):
+class OpenAIClient(HTTPProvider):
     """Minimal OpenAI Chat Completions client via REST.
 
     We use the widely supported `v1/chat/completions` endpoint for maximum
     compatibility. This keeps dependencies light and makes caching deterministic.
 
     Authentication: supply `api_key` or set env var `OPENAI_API_KEY`.
+    `base_url` can point at any OpenAI-compatible server.
     """
 
     name = "openai"
 
-    def __init__(self, api_key: Optional[str] = None, base_url: str = "https://api.openai.com/v1"):
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        http: Optional[HTTPOptions] = None,
+    ):
         self.api_key = api_key or os.environ.get("OPENAI_API_KEY")
         if not self.api_key:
             raise LLMProviderError("Missing OpenAI API key (set OPENAI_API_KEY or pass api_key)")
-        self.base_url = base_url.rstrip("/")
+        super().__init__(base_url or "https://api.openai.com/v1", http)
 
-    def generate(self, req: LLMRequest) -> LLMResponse:
-        url = f"{self.base_url}/chat/completions"
-        payload: Dict[str, Any] = {
+    def _payload(self, req: LLMRequest) -> Dict[str, Any]:
+        system = {"role": "system", "content": req.system_prompt}
+        return {
             "model": req.model,
-            "messages": [
-                {"role": "system", "content": req.system_prompt},
+            "messages": [system, *req.messages] if req.messages is not None else [
+                system,
                 {"role": "user", "content": req.user_prompt},
             ],
             "temperature": req.temperature,
@@ -38,21 +46,82 @@ class OpenAIClient(LLMProvider):
             "max_tokens": req.max_output_tokens,
         }
 
-        headers = {
+    def _headers(self) -> Dict[str, str]:
+        return {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json",
         }
 
+    def _parse(self, r: httpx.Response) -> LLMResponse:
+        if r.status_code >= 400:
+            raise LLMProviderError(
+                f"OpenAI HTTP {r.status_code}: {r.text[:300]}",
+                status_code=r.status_code,
+                retry_after=parse_retry_after(r.headers.get("retry-after")),
+            )
+        raw = r.json()
+        text = raw["choices"][0]["message"]["content"]
+        usage = raw.get("usage")
+        return LLMResponse(text=text, raw=raw, usage=usage)
+
+    def generate(self, req: LLMRequest) -> LLMResponse:
+        try:
+            r = self.client().post("chat/completions", json=self._payload(req), timeout=req.timeout_s)
+            return self._parse(r)
+        except httpx.RequestError as e:
+            raise LLMProviderError(f"OpenAI request failed: {e}", retryable=True)
+        except LLMProviderError:
+            raise
+        except Exception as e:
+            raise LLMProviderError(f"OpenAI parse failed: {e}")
+
+    async def agenerate(self, req: LLMRequest) -> LLMResponse:
+        try:
+            r = await self.aclient().post("chat/completions", json=self._payload(req), timeout=req.timeout_s)
+            return self._parse(r)
+        except httpx.RequestError as e:
+            raise LLMProviderError(f"OpenAI request failed: {e}", retryable=True)
+        except LLMProviderError:
+            raise
+        except Exception as e:
+            raise LLMProviderError(f"OpenAI parse failed: {e}")
+
+    def _stream_payload(self, req: LLMRequest) -> Dict[str, Any]:
+        return {**self._payload(req), "stream": True, "stream_options": {"include_usage": True}}
+
+    @staticmethod
+    def _stream_event(data: str) -> StreamEvent:
+        chunk = json.loads(data)
+        choices = chunk.get("choices") or []
+        delta = (choices[0].get("delta") or {}).get("content") if choices else None
+        return StreamEvent(text=delta or "", usage=chunk.get("usage"))
+
+    def stream(self, req: LLMRequest) -> Iterator[StreamEvent]:
+        try:
+            with self.client().stream("POST", "chat/completions", json=self._stream_payload(req), timeout=req.timeout_s) as r:
+                if r.status_code >= 400:
+                    r.read()
+                    self._parse(r)
+                for data in sse_events(r.iter_lines()):
+                    yield self._stream_event(data)
+        except httpx.RequestError as e:
+            raise LLMProviderError(f"OpenAI request failed: {e}", retryable=True)
+        except LLMProviderError:
+            raise
+        except Exception as e:
+            raise LLMProviderError(f"OpenAI parse failed: {e}")
+
+    async def astream(self, req: LLMRequest) -> AsyncIterator[StreamEvent]:
         try:
-            with httpx.Client(timeout=req.timeout_s) as client:
-                r = client.post(url, json=payload, headers=headers)
-            if r.status_code >= 400:
-                raise LLMProviderError(f"OpenAI HTTP {r.status_code}: {r.text[:300]}")
-            raw = r.json()
-            text = raw["choices"][0]["message"]["content"]
-            usage = raw.get("usage")
-            return LLMResponse(text=text, raw=raw, usage=usage)
+            async with self.aclient().stream("POST", "chat/completions", json=self._stream_payload(req), timeout=req.timeout_s) as r:
+                if r.status_code >= 400:
+                    await r.aread()
+                    self._parse(r)
+                async for data in asse_events(r.aiter_lines()):
+                    yield self._stream_event(data)
         except httpx.RequestError as e:
-            raise LLMProviderError(f"OpenAI request failed: {e}")
+            raise LLMProviderError(f"OpenAI request failed: {e}", retryable=True)
+        except LLMProviderError:
+            raise
         except Exception as e:
             raise LLMProviderError(f"OpenAI parse failed: {e}")
@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from contextlib import nullcontext
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from apig.llm.limits import ConcurrencyLimiter, RetryPolicy, TokenBucket
+from .base import LLMProvider, LLMProviderError, LLMRequest, LLMResponse, StopCheck
+
+
+def estimate_tokens(req: LLMRequest) -> int:
+    # ~4 characters per token for the prompt, plus the full output budget.
+    chars = sum(len(m["content"]) for m in req.messages) if req.messages is not None else len(req.user_prompt)
+    return (len(req.system_prompt) + chars) // 4 + req.max_output_tokens
+
+
+def usage_tokens(usage: Optional[Dict[str, Any]]) -> Optional[int]:
+    if not usage:
+        return None
+    for k in ("total_tokens", "totalTokenCount"):
+        if isinstance(usage.get(k), int):
+            return usage[k]
+    return None
+
+
+class RateLimitedProvider(LLMProvider):
+    """Wraps a provider with request/token buckets, retries and throttle feedback.
+
+    - `requests` / `tokens`: buckets (per minute) to wait on before each call;
+      the token charge is an estimate, corrected from reported usage
+    - retryable errors (429, 5xx, transport failures) are retried per `retry`,
+      honoring Retry-After
+    - async calls hold a slot of the adaptive `limiter` (see ConcurrencyLimiter)
+      per attempt only, never while sleeping on a bucket or a backoff;
+      throttling responses halve it and successes grow it back
+    """
+
+    def __init__(
+        self,
+        inner: LLMProvider,
+        requests: Optional[TokenBucket] = None,
+        tokens: Optional[TokenBucket] = None,
+        retry: RetryPolicy = RetryPolicy(),
+        limiter: Optional[ConcurrencyLimiter] = None,
+        sleep: Callable[[float], None] = time.sleep,
+        asleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+    ):
+        self.inner = inner
+        self.name = inner.name
+        self.requests = requests
+        self.tokens = tokens
+        self.retry = retry
+        self.limiter = limiter
+        self._sleep = sleep
+        self._asleep = asleep
+        self.retries = 0
+        self.throttled = 0
+
+    def _admit(self, req: LLMRequest) -> float:
+        wait = 0.0
+        if self.requests is not None:
+            wait = max(wait, self.requests.reserve(1))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.reserve(estimate_tokens(req)))
+        return wait
+
+    def _settle(self, req: LLMRequest, resp: LLMResponse) -> None:
+        used = usage_tokens(resp.usage)
+        if self.tokens is not None and used is not None:
+            self.tokens.adjust(estimate_tokens(req) - used)
+        if self.limiter is not None:
+            self.limiter.on_success()
+
+    def _backoff(self, e: LLMProviderError, attempt: int) -> float:
+        if not e.retryable or attempt >= self.retry.max_retries:
+            raise e
+        self.retries += 1
+        if e.throttled:
+            self.throttled += 1
+            if self.limiter is not None:
+                self.limiter.on_throttle()
+        return self.retry.delay(attempt, e.retry_after)
+
+    def _call(self, req: LLMRequest, call: Callable[[], LLMResponse]) -> LLMResponse:
+        attempt = 0
+        while True:
+            wait = self._admit(req)
+            if wait > 0:
+                self._sleep(wait)
+            try:
+                resp = call()
+            except LLMProviderError as e:
+                self._sleep(self._backoff(e, attempt))
+                attempt += 1
+                continue
+            self._settle(req, resp)
+            return resp
+
+    async def _acall(self, req: LLMRequest, call: Callable[[], Awaitable[LLMResponse]]) -> LLMResponse:
+        attempt = 0
+        while True:
+            wait = self._admit(req)
+            if wait > 0:
+                await self._asleep(wait)
+            try:
+                async with self.limiter or nullcontext():
+                    resp = await call()
+            except LLMProviderError as e:
+                await self._asleep(self._backoff(e, attempt))
+                attempt += 1
+                continue
+            self._settle(req, resp)
+            return resp
+
+    def generate(self, req: LLMRequest) -> LLMResponse:
+        return self._call(req, lambda: self.inner.generate(req))
+
+    async def agenerate(self, req: LLMRequest) -> LLMResponse:
+        return await self._acall(req, lambda: self.inner.agenerate(req))
+
+    # A failure mid-stream retries the whole completion (with a fresh stop check).
+    def generate_until(self, req: LLMRequest, make_stop: Callable[[], StopCheck]) -> LLMResponse:
+        return self._call(req, lambda: self.inner.generate_until(req, make_stop))
+
+    async def agenerate_until(self, req: LLMRequest, make_stop: Callable[[], StopCheck]) -> LLMResponse:
+        return await self._acall(req, lambda: self.inner.agenerate_until(req, make_stop))
+
+    def close(self) -> None:
+        self.inner.close()
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
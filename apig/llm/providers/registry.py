@@ -1,16 +1,29 @@
 from __future__ import annotations
 
-from typing import Optional
+from typing import Any, Optional
 
 from .base import LLMProvider
+from .http import HTTPOptions
 from .openai_client import OpenAIClient
 from .gemini_client import GeminiClient
+from .replay import ReplayProvider
 
+PROVIDERS = ("openai", "gemini", "replay")
 
-def get_provider(name: str, api_key: Optional[str] = None) -> LLMProvider:
+
+def get_provider(
+    name: str,
+    api_key: Optional[str] = None,
+    base_url: Optional[str] = None,
+    http: Optional[HTTPOptions] = None,
+    **options: Any,
+) -> LLMProvider:
+    """Build a provider. `options` are provider specific (see ReplayProvider)."""
     name = name.lower().strip()
     if name == "openai":
-        return OpenAIClient(api_key=api_key)
+        return OpenAIClient(api_key=api_key, base_url=base_url, http=http)
     if name == "gemini":
-        return GeminiClient(api_key=api_key)
-    raise ValueError(f"Unknown provider: {name} (expected 'openai' or 'gemini')")
+        return GeminiClient(api_key=api_key, base_url=base_url, http=http)
+    if name == "replay":
+        return ReplayProvider(**options)
+    raise ValueError(f"Unknown provider: {name} (expected one of {list(PROVIDERS)})")
@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import replace
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from apig.llm.cache import LLMCache, request_key, request_payload
+from .base import LLMProvider, LLMProviderError, LLMRequest, LLMResponse, StopCheck
+
+_STEP_RE = re.compile(r"You are at step (\d+)\.")
+_PATH_RE = re.compile(r"/sandbox/[\w./-]+\w")
+
+
+def scripted_policy(req: LLMRequest) -> str:
+    """Deterministic stand-in for a model: read the first sandbox file the
+    task mentions, then finish."""
+    m = _STEP_RE.search(req.user_prompt)
+    task = req.user_prompt.split("You are at step", 1)[0]
+    path = _PATH_RE.search(task)
+    if m and m.group(1) == "0" and path:
+        return json.dumps({"type": "tool", "name": "read_file", "args": {"path": path.group(0)}})
+    return json.dumps({"type": "final", "answer": "Done."})
+
+
+def parse_latency(spec: Optional[str], seed: int = 0) -> Optional[Callable[[], float]]:
+    """Simulated latency sampler from `fixed:S`, `uniform:LO,HI`,
+    `exp:MEAN` or `lognormal:MU,SIGMA` (seconds)."""
+    if not spec:
+        return None
+    kind, _, args = spec.partition(":")
+    try:
+        vals = [float(x) for x in args.split(",") if x.strip()]
+    except ValueError:
+        vals = []
+    rng = random.Random(seed)
+    samplers = {
+        ("fixed", 1): lambda: vals[0],
+        ("uniform", 2): lambda: rng.uniform(vals[0], vals[1]),
+        ("exp", 1): lambda: rng.expovariate(1.0 / vals[0]),
+        ("lognormal", 2): lambda: rng.lognormvariate(vals[0], vals[1]),
+    }
+    sampler = samplers.get((kind.strip().lower(), len(vals)))
+    if sampler is None:
+        raise ValueError(f"Bad latency spec {spec!r} (expected fixed:S, uniform:LO,HI, exp:MEAN or lognormal:MU,SIGMA)")
+    return sampler
+
+
+def load_transcript(path: str) -> Dict[str, Dict[str, Any]]:
+    """key -> response from a transcript written by RecordingProvider."""
+    out: Dict[str, Dict[str, Any]] = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                rec = json.loads(line)
+                out[rec["key"]] = rec["response"]
+    return out
+
+
+class ReplayProvider(LLMProvider):
+    """Serves recorded responses instead of calling a model (no network, no key).
+
+    Sources are an LLMCache database (`--llm-cache-path` of an earlier run)
+    and/or a transcript written by RecordingProvider. Lookups use the cache
+    key of the request as the recording provider (`recorded_as`, e.g.
+    "openai") would have sent it. On a miss, strict mode raises; lenient mode
+    answers with `fallback` (scripted_policy by default). `latency` adds a
+    simulated delay per call.
+    """
+
+    name = "replay"
+
+    def __init__(
+        self,
+        cache_path: Optional[str] = None,
+        transcript: Optional[str] = None,
+        strict: bool = True,
+        recorded_as: Optional[str] = None,
+        latency: Optional[str] = None,
+        seed: int = 0,
+        fallback: Callable[[LLMRequest], str] = scripted_policy,
+    ):
+        if not cache_path and not transcript:
+            raise LLMProviderError("Replay provider needs a cache database or a transcript to replay")
+        self._cache = LLMCache(Path(cache_path)) if cache_path else None
+        self._transcript = load_transcript(transcript) if transcript else {}
+        self.strict = strict
+        self.recorded_as = recorded_as
+        self._latency = parse_latency(latency, seed)
+        self._lock = threading.Lock()
+        self.fallback = fallback
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, req: LLMRequest) -> LLMResponse:
+        key = request_key(req, self.recorded_as)
+        rec = self._transcript.get(key)
+        if rec is None and self._cache is not None:
+            rec = self._cache.get(key)
+        if rec is not None:
+            self.hits += 1
+            return LLMResponse(text=rec["text"], raw=rec.get("raw") or {}, usage=rec.get("usage"), source="replayed")
+        self.misses += 1
+        if self.strict:
+            raise LLMProviderError(f"Replay miss for request {key[:16]} (model={req.model})", retryable=False)
+        return LLMResponse(text=self.fallback(req), raw={"replay": "fallback"}, source="replayed")
+
+    def _delay(self) -> float:
+        if self._latency is None:
+            return 0.0
+        with self._lock:
+            return max(0.0, self._latency())
+
+    def generate(self, req: LLMRequest) -> LLMResponse:
+        delay = self._delay()
+        if delay:
+            time.sleep(delay)
+        return self._lookup(req)
+
+    async def agenerate(self, req: LLMRequest) -> LLMResponse:
+        delay = self._delay()
+        if delay:
+            await asyncio.sleep(delay)
+        return self._lookup(req)
+
+    # Streaming a recording cuts its text like a live stream, but stays unpaid.
+    def generate_until(self, req: LLMRequest, make_stop: Callable[[], StopCheck]) -> LLMResponse:
+        return replace(super().generate_until(req, make_stop), source="replayed")
+
+    async def agenerate_until(self, req: LLMRequest, make_stop: Callable[[], StopCheck]) -> LLMResponse:
+        return replace(await super().agenerate_until(req, make_stop), source="replayed")
+
+    def close(self) -> None:
+        if self._cache is not None:
+            self._cache.close()
+
+
+class RecordingProvider(LLMProvider):
+    """Passes calls through to `inner`, appending each exchange to a JSONL
+    transcript that ReplayProvider can serve later."""
+
+    def __init__(self, inner: LLMProvider, path: str):
+        self.inner = inner
+        self.name = inner.name
+        self._f = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def _record(self, req: LLMRequest, resp: LLMResponse) -> None:
+        rec = {
+            "key": request_key(req),
+            "request": request_payload(req),
+            "response": {"text": resp.text, "usage": resp.usage},
+        }
+        with self._lock:
+            self._f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            self._f.flush()
+
+    def generate(self, req: LLMRequest) -> LLMResponse:
+        resp = self.inner.generate(req)
+        self._record(req, resp)
+        return resp
+
+    async def agenerate(self, req: LLMRequest) -> LLMResponse:
+        resp = await self.inner.agenerate(req)
+        self._record(req, resp)
+        return resp
+
+    # Streamed completions are recorded as cut off (what the agent saw).
+    def generate_until(self, req: LLMRequest, make_stop: Callable[[], StopCheck]) -> LLMResponse:
+        resp = self.inner.generate_until(req, make_stop)
+        self._record(req, resp)
+        return resp
+
+    async def agenerate_until(self, req: LLMRequest, make_stop: Callable[[], StopCheck]) -> LLMResponse:
+        resp = await self.inner.agenerate_until(req, make_stop)
+        self._record(req, resp)
+        return resp
+
+    def close(self) -> None:
+        self.inner.close()
+        if not self._f.closed:
+            self._f.close()
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
+        self.close()
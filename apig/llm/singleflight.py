@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class _LeaderCancelled(Exception):
+    """Set on a flight whose leader was cancelled, so its waiters retry."""
+
+
+class SingleFlight:
+    """Coalesces concurrent async calls that share a key.
+
+    The first caller for a key runs `fn`; callers arriving while it is in
+    flight await the same result (or exception) instead of repeating the
+    call. Nothing is remembered once the call completes, which is the cache's
+    job. In-flight calls are tracked per event loop.
+
+    If the leader is cancelled, its waiters are not: one of them runs `fn`
+    again as the new leader and the others wait on it.
+    """
+
+    def __init__(self) -> None:
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._inflight = {}
+            self._loop = loop
+        joined = False
+        while True:
+            fut = self._inflight.get(key)
+            if fut is None:
+                break
+            if not joined:
+                self.shared += 1
+                joined = True
+            try:
+                # Shielded: a waiter being cancelled must not cancel the leader's call.
+                return await asyncio.shield(fut)
+            except _LeaderCancelled:
+                continue  # take over (or join whoever did)
+        if joined:
+            self.shared -= 1  # it became a call of its own after all
+
+        fut = self._inflight[key] = loop.create_future()
+        self.calls += 1
+        try:
+            res = await fn()
+        except asyncio.CancelledError:
+            fut.set_exception(_LeaderCancelled())
+            fut.exception()
+            raise
+        except BaseException as e:
+            fut.set_exception(e)
+            fut.exception()  # retrieved: waiters (if any) re-raise it
+            raise
+        else:
+            fut.set_result(res)
+            return res
+        finally:
+            del self._inflight[key]
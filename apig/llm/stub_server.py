@@ -0,0 +1,313 @@
+from __future__ import annotations
+
+import json
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from apig.llm.providers.base import LLMRequest, MessageLog
+from apig.llm.providers.replay import parse_latency, scripted_policy
+
+# Turns a request into response text (see scripted_policy / ReplayProvider).
+Responder = Callable[[LLMRequest], str]
+
+_GEMINI_RE = re.compile(r"/models/([^/:]+):(generateContent|streamGenerateContent)$")
+# Streamed responses are sent in pieces of this many characters (~2 tokens).
+_STREAM_PIECE = 8
+_RAMBLE = "Let me also explain my reasoning in more detail, step by step, before moving on. "
+# Conversations the simulated prompt cache remembers.
+_PREFIX_CACHE_SIZE = 65536
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # The stdlib default backlog (5) refuses connections under load-test fan-out.
+    request_queue_size = 1024
+
+
+@dataclass(frozen=True)
+class StubProfile:
+    """How the stub server misbehaves.
+
+    - latency: sampler spec as for the replay provider (`uniform:0.2,0.8`, ...)
+    - error_rate / throttle_rate: share of requests answered 500 / 429
+    - max_concurrency: requests beyond this many in flight get 429 too
+    - retry_after: Retry-After seconds sent with 429s
+    - ramble_chars / stream_piece_s: trailing prose per response, and the
+      generation time per ~2-token piece (streamed or not), to exercise
+      early stopping
+    """
+
+    latency: Optional[str] = None
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    max_concurrency: Optional[int] = None
+    retry_after: float = 1.0
+    seed: int = 0
+    # Prose appended after every response (models that keep talking after the
+    # JSON action), and the delay between pieces of a streamed response.
+    ramble_chars: int = 0
+    stream_piece_s: float = 0.0
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class StubServer:
+    """Local OpenAI (`/v1/chat/completions`) and Gemini
+    (`/v1beta/models/{model}:generateContent`) endpoint for load tests.
+
+    Responses come from `responder` (a scripted policy by default). Each
+    response body includes `"stub": {"server_ms": ...}`, the time the server
+    spent on it, so clients can separate their own overhead.
+    Multi-turn requests that extend an earlier exchange report the reused
+    prefix as cached prompt tokens, like provider-side prompt caching.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        profile: StubProfile = StubProfile(),
+        responder: Responder = scripted_policy,
+    ):
+        self.profile = profile
+        self.responder = responder
+        self._latency = parse_latency(profile.latency, profile.seed)
+        self._rng = random.Random(profile.seed)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.stats: Dict[str, int] = {"requests": 0, "ok": 0, "throttled": 0, "errors": 0, "cancelled": 0}
+        self._prefixes: "OrderedDict[str, None]" = OrderedDict()
+        self._httpd = _Server((host, port), self._handler_class())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _admit(self) -> Tuple[Optional[int], float]:
+        """(error status or None, simulated latency) for a new request."""
+        with self._lock:
+            self.stats["requests"] += 1
+            self.in_flight += 1
+            roll = self._rng.random()
+            delay = max(0.0, self._latency()) if self._latency else 0.0
+            over = self.profile.max_concurrency is not None and self.in_flight > self.profile.max_concurrency
+        if over or roll < self.profile.throttle_rate:
+            return 429, 0.0
+        if roll < self.profile.throttle_rate + self.profile.error_rate:
+            return 500, delay
+        return None, delay
+
+    def _finish(self, key: str) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self.stats[key] += 1
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; without TCP_NODELAY
+            # Nagle + delayed ACK adds ~40 ms to every response.
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def _send(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_stream(self, events: List[Dict[str, Any]], done: bool) -> None:
+                """Server-sent events over chunked transfer encoding."""
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                lines = [json.dumps(ev) for ev in events] + (["[DONE]"] if done else [])
+                try:
+                    for i, line in enumerate(lines):
+                        if i and server.profile.stream_piece_s:
+                            time.sleep(server.profile.stream_piece_s)
+                        data = f"data: {line}\n\n".encode("utf-8")
+                        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client stopped reading (e.g. it had the JSON it needed).
+                    self.close_connection = True
+                    with server._lock:
+                        server.stats["cancelled"] += 1
+
+            def do_POST(self) -> None:
+                t0 = time.perf_counter()
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                path = self.path.split("?", 1)[0]
+                gemini = _GEMINI_RE.search(path)
+                if not gemini and not path.endswith("/chat/completions"):
+                    self._send(404, {"error": {"message": f"unknown endpoint {path}"}})
+                    return
+                status, delay = server._admit()
+                try:
+                    if delay:
+                        time.sleep(delay)
+                    if status == 429:
+                        server._finish("throttled")
+                        self._send(429, {"error": {"message": "rate limited (stub)"}}, {"Retry-After": f"{server.profile.retry_after:g}"})
+                        return
+                    if status == 500:
+                        server._finish("errors")
+                        self._send(500, {"error": {"message": "internal error (stub)"}})
+                        return
+                    if gemini:
+                        req, text = server._gemini(gemini.group(1), payload)
+                    else:
+                        req, text = server._openai(payload)
+                    if server.profile.ramble_chars:
+                        text += " " + (_RAMBLE * (server.profile.ramble_chars // len(_RAMBLE) + 1))[: server.profile.ramble_chars]
+                except Exception as e:
+                    server._finish("errors")
+                    self._send(500, {"error": {"message": f"stub responder failed: {e}"}})
+                    return
+                server._finish("ok")
+                streaming = gemini.group(2) == "streamGenerateContent" if gemini else bool(payload.get("stream"))
+                pieces = [text[i : i + _STREAM_PIECE] for i in range(0, len(text), _STREAM_PIECE)]
+                if server.profile.stream_piece_s and not streaming:
+                    # A whole response arrives once every piece is generated.
+                    time.sleep(len(pieces) * server.profile.stream_piece_s)
+                stub = {"server_ms": (time.perf_counter() - t0) * 1000}
+                turns = list(req.messages) if req.messages is not None else [{"role": "user", "content": req.user_prompt}]
+                usage_in, usage_out = _tokens(req.system_prompt + "".join(m["content"] for m in turns)), _tokens(text)
+                cached = server._prompt_cache(req.system_prompt, turns)
+                if gemini:
+                    usage = {"promptTokenCount": usage_in, "candidatesTokenCount": usage_out, "totalTokenCount": usage_in + usage_out}
+                    if cached:
+                        usage["cachedContentTokenCount"] = cached
+                    if streaming:
+                        events = [{"candidates": [{"content": {"role": "model", "parts": [{"text": p}]}}]} for p in pieces]
+                        self._send_stream(events + [{"candidates": [], "usageMetadata": usage}], done=False)
+                        return
+                    body = {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}], "usageMetadata": usage}
+                else:
+                    usage = {"prompt_tokens": usage_in, "completion_tokens": usage_out, "total_tokens": usage_in + usage_out}
+                    if cached:
+                        usage["prompt_tokens_details"] = {"cached_tokens": cached}
+                    if streaming:
+                        events = [{"object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {"content": p}}]} for p in pieces]
+                        self._send_stream(events + [{"object": "chat.completion.chunk", "choices": [], "usage": usage}], done=True)
+                        return
+                    body = {
+                        "object": "chat.completion",
+                        "model": req.model,
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                        "usage": usage,
+                    }
+                body["stub"] = stub
+                self._send(200, body)
+
+        return Handler
+
+    def _prompt_cache(self, system: str, turns: List[Dict[str, str]]) -> int:
+        """Simulated provider prompt caching: the tokens of the previous
+        request's prompt (all but the last assistant/user pair) if this one
+        extends a prompt seen before."""
+        head = [{"role": "system", "content": system}]
+        prefix = MessageLog.of(head + turns[:-2]).digest if len(turns) >= 3 else None
+        with self._lock:
+            hit = prefix is not None and prefix in self._prefixes
+            self._prefixes[MessageLog.of(head + turns).digest] = None
+            while len(self._prefixes) > _PREFIX_CACHE_SIZE:
+                self._prefixes.popitem(last=False)
+        if not hit:
+            return 0
+        return _tokens(system + "".join(m["content"] for m in turns[:-2]))
+
+    def _openai(self, payload: Dict[str, Any]) -> Tuple[LLMRequest, str]:
+        msgs = payload.get("messages", [])
+        system = "".join(m.get("content", "") for m in msgs if m.get("role") == "system")
+        turns = [{"role": m.get("role", "user"), "content": m.get("content", "")} for m in msgs if m.get("role") != "system"]
+        req = LLMRequest(
+            provider="openai",
+            model=payload.get("model", ""),
+            system_prompt=system,
+            user_prompt=turns[-1]["content"] if turns else "",
+            temperature=payload.get("temperature", 0.0),
+            top_p=payload.get("top_p", 1.0),
+            max_output_tokens=payload.get("max_tokens", 512),
+            # A single user turn is indistinguishable from a single-turn request.
+            messages=MessageLog.of(turns) if len(turns) > 1 else None,
+        )
+        return req, self.responder(req)
+
+    def _gemini(self, model: str, payload: Dict[str, Any]) -> Tuple[LLMRequest, str]:
+        def text(content: Dict[str, Any]) -> str:
+            return "".join(p.get("text", "") for p in content.get("parts") or [])
+
+        turns = [
+            {"role": "assistant" if c.get("role") == "model" else "user", "content": text(c)}
+            for c in payload.get("contents") or []
+        ]
+        system = payload.get("systemInstruction")
+        cfg = payload.get("generationConfig") or {}
+        # Single-turn, the Gemini client sends "system\n\nuser" as one text part,
+        # so replayed Gemini responses only match through a lenient replay's fallback.
+        req = LLMRequest(
+            provider="gemini",
+            model=model,
+            system_prompt=text(system) if system else "",
+            user_prompt=turns[-1]["content"] if turns else "",
+            temperature=cfg.get("temperature", 0.0),
+            top_p=cfg.get("topP", 1.0),
+            max_output_tokens=cfg.get("maxOutputTokens", 512),
+            messages=MessageLog.of(turns) if system else None,
+        )
+        return req, self.responder(req)
+
+    def start(self) -> "StubServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="apig-stub-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        """Serve in the calling thread until interrupted."""
+        try:
+            self._httpd.serve_forever()
+        finally:
+            self._httpd.server_close()
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "StubServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def replay_responder(replay: Any) -> Responder:
+    """Responder answering from a ReplayProvider (use one without simulated
+    latency; the server applies its own profile)."""
+
+    def respond(req: LLMRequest) -> str:
+        return replay.generate(req).text
+
+    return respond
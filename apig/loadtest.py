@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import math
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Sequence
+
+from apig.agents.llm_agent import LLMConfig, LLMDrivenAgent
+from apig.llm.providers.base import LLMProvider, LLMRequest, LLMResponse, StopCheck
+from apig.llm.providers.http import HTTPOptions
+from apig.llm.providers.registry import get_provider
+from apig.runner import EpisodeOptions, plan_episodes, plan_variants, run_episodes
+
+
+def percentile(sorted_values: Sequence[float], q: float) -> float:
+    """Nearest-rank percentile (q in [0, 100]) of pre-sorted values."""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, math.ceil(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+class TimedProvider(LLMProvider):
+    """Records wall time per call, and the server's own time when the
+    response reports it (the stub server's `"stub": {"server_ms": ...}`;
+    streamed responses do not, so they have no overhead figure)."""
+
+    def __init__(self, inner: LLMProvider):
+        self.inner = inner
+        self.name = inner.name
+        self.latencies_ms: List[float] = []
+        self.overheads_ms: List[float] = []
+        self._lock = threading.Lock()
+
+    def _record(self, t0: float, resp: LLMResponse) -> None:
+        ms = (time.perf_counter() - t0) * 1000
+        server_ms = (resp.raw.get("stub") or {}).get("server_ms") if isinstance(resp.raw, dict) else None
+        with self._lock:
+            self.latencies_ms.append(ms)
+            if server_ms is not None:
+                self.overheads_ms.append(ms - server_ms)
+
+    def generate(self, req: LLMRequest) -> LLMResponse:
+        t0 = time.perf_counter()
+        resp = self.inner.generate(req)
+        self._record(t0, resp)
+        return resp
+
+    async def agenerate(self, req: LLMRequest) -> LLMResponse:
+        t0 = time.perf_counter()
+        resp = await self.inner.agenerate(req)
+        self._record(t0, resp)
+        return resp
+
+    def generate_until(self, req: LLMRequest, make_stop: Callable[[], StopCheck]) -> LLMResponse:
+        t0 = time.perf_counter()
+        resp = self.inner.generate_until(req, make_stop)
+        self._record(t0, resp)
+        return resp
+
+    async def agenerate_until(self, req: LLMRequest, make_stop: Callable[[], StopCheck]) -> LLMResponse:
+        t0 = time.perf_counter()
+        resp = await self.inner.agenerate_until(req, make_stop)
+        self._record(t0, resp)
+        return resp
+
+    def close(self) -> None:
+        self.inner.close()
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
+
+
+@dataclass
+class LoadTestResult:
+    episodes: int
+    wall_s: float
+    requests: int
+    retries: int
+    throttled: int
+    latencies_ms: List[float] = field(repr=False, default_factory=list)
+    overheads_ms: List[float] = field(repr=False, default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        lat = sorted(self.latencies_ms)
+        out = {
+            "episodes": self.episodes,
+            "wall_s": self.wall_s,
+            "episodes_per_s": self.episodes / self.wall_s if self.wall_s else 0.0,
+            "requests": self.requests,
+            "requests_per_s": self.requests / self.wall_s if self.wall_s else 0.0,
+            "step_p50_ms": percentile(lat, 50),
+            "step_p95_ms": percentile(lat, 95),
+            "step_p99_ms": percentile(lat, 99),
+            "retries": self.retries,
+            "throttled": self.throttled,
+        }
+        # Only measurable when responses report the server's time (not streamed).
+        if self.overheads_ms:
+            out["client_overhead_mean_ms"] = sum(self.overheads_ms) / len(self.overheads_ms)
+        return out
+
+
+def run_loadtest(
+    base_url: str,
+    provider: str = "openai",
+    model: str = "stub",
+    suites: Sequence[str] = ("inbox", "rag_policy", "web_form"),
+    episodes: int = 50,
+    concurrency: int = 200,
+    defended: bool = False,
+    coalesce: bool = False,
+    max_retries: int = 5,
+    stream: bool = False,
+) -> LoadTestResult:
+    """Drive LLMDrivenAgent episodes against `base_url` (e.g. a StubServer)
+    on one event loop and time every provider call."""
+    http = HTTPOptions(max_connections=concurrency, max_keepalive_connections=concurrency)
+    timed = TimedProvider(get_provider(provider, api_key="stub", base_url=base_url, http=http))
+    cfg = LLMConfig(
+        provider=provider,
+        model=model,
+        max_concurrency=concurrency,
+        max_retries=max_retries,
+        coalesce=coalesce,
+        stream=stream,
+    )
+    agent = LLMDrivenAgent(
+        name="llm_defended" if defended else "llm_naive", config=cfg, defended=defended, provider=timed
+    )
+    variants = plan_variants([], 0)
+    specs = plan_episodes(list(suites), variants, episodes)
+    t0 = time.perf_counter()
+    n = sum(1 for _ in run_episodes(specs, lambda: agent, variants, 0, concurrency=concurrency, options=EpisodeOptions(trace_level="none")))
+    wall = time.perf_counter() - t0
+    return LoadTestResult(
+        episodes=n,
+        wall_s=wall,
+        requests=len(timed.latencies_ms),
+        retries=agent.provider.retries,
+        throttled=agent.provider.throttled,
+        latencies_ms=timed.latencies_ms,
+        overheads_ms=timed.overheads_ms,
+    )
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Optional, TextIO
+
+from apig.env.types import EpisodeResult, ToolCall, TraceEvent
+
+
+def episode_to_dict(r: EpisodeResult) -> Dict[str, Any]:
+    """JSON-ready form of one episode as written to reports."""
+    d = {
+        "episode_id": r.episode_id,
+        "suite": r.suite,
+        "task_id": r.task_id,
+        "attack_id": r.attack_id,
+        "attack_goal": r.attack_goal,
+        "attack_channel": r.attack_channel,
+        "attack_stealth": r.attack_stealth,
+        "attacked": r.attacked,
+        "success": r.success,
+        "uar_attempted": r.uar_attempted,
+        "uar_executed": r.uar_executed,
+        "ser_attempted": r.ser_attempted,
+        "ser_executed": r.ser_executed,
+        "uar": r.uar,
+        "ser": r.ser,
+        "forbidden_calls": [{"name": c.name, "args": c.args} for c in r.forbidden_calls],
+        "egress_hits": r.egress_hits,
+        "first_leak_step": r.first_leak_step,
+        "files_written": r.files_written,
+        "policy_hits": r.policy_hits,
+        "trace": [{"t": e.t, "kind": e.kind, "data": e.data} for e in r.trace],
+    }
+    if r.llm_usage:  # LLM agents only
+        d["llm_usage"] = r.llm_usage
+    return d
+
+
+def episode_from_dict(d: Dict[str, Any], with_trace: bool = True) -> EpisodeResult:
+    """Inverse of episode_to_dict(). Scoring alone can skip the trace."""
+    return EpisodeResult(
+        episode_id=d["episode_id"],
+        suite=d["suite"],
+        task_id=d["task_id"],
+        attacked=d["attacked"],
+        success=d["success"],
+        uar_attempted=d["uar_attempted"],
+        uar_executed=d["uar_executed"],
+        ser_attempted=d["ser_attempted"],
+        ser_executed=d["ser_executed"],
+        uar=d["uar"],
+        ser=d["ser"],
+        forbidden_calls=[ToolCall(c["name"], c["args"]) for c in d.get("forbidden_calls", [])],
+        egress_hits=list(d.get("egress_hits", [])),
+        trace=[TraceEvent(t=e["t"], kind=e["kind"], data=e["data"]) for e in d.get("trace", [])] if with_trace else [],
+        attack_id=d.get("attack_id"),
+        attack_goal=d.get("attack_goal"),
+        attack_channel=d.get("attack_channel"),
+        attack_stealth=d.get("attack_stealth"),
+        first_leak_step=d.get("first_leak_step"),
+        files_written=dict(d.get("files_written", {})),
+        policy_hits=dict(d.get("policy_hits", {})),
+        llm_usage=dict(d.get("llm_usage", {})),
+    )
+
+
+def iter_report_episodes(path: str, with_trace: bool = False) -> Iterator[EpisodeResult]:
+    """Episodes of a JSON or JSONL report. JSONL reports are streamed line by line."""
+    with open(path, encoding="utf-8") as f:
+        try:
+            first = json.loads(f.readline())
+        except ValueError:
+            first = None
+        if isinstance(first, dict) and "type" in first:
+            f.seek(0)
+            for line in f:
+                if line.strip():
+                    rec = json.loads(line)
+                    if rec.get("type") == "episode":
+                        yield episode_from_dict(rec, with_trace)
+            return
+        f.seek(0)
+        data = json.load(f)
+    for d in data.get("episodes", []):
+        yield episode_from_dict(d, with_trace)
+
+
+def write_json_report(path: str, summary: Dict[str, Any], results: Iterable[EpisodeResult]) -> None:
+    data = {
+        "summary": summary,
+        "episodes": [episode_to_dict(r) for r in results],
+    }
+    Path(path).write_text(json.dumps(data, indent=2), encoding="utf-8")
+
+
+class JsonlReportWriter:
+    """Streams a report as JSON Lines.
+
+    Each finished episode is written (and flushed) as one
+    `{"type": "episode", ...}` line; the run summary follows as a trailing
+    `{"type": "summary", "summary": {...}}` line. A crashed run therefore
+    still leaves every completed episode on disk.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._f: Optional[TextIO] = open(path, "w", encoding="utf-8")
+
+    def _write(self, rec: Dict[str, Any]) -> None:
+        assert self._f is not None, "writer is closed"
+        self._f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        self._f.flush()
+
+    def write_episode(self, r: EpisodeResult) -> None:
+        self._write({"type": "episode", **episode_to_dict(r)})
+
+    def write_summary(self, summary: Dict[str, Any]) -> None:
+        self._write({"type": "summary", "summary": summary})
+
+    def close(self) -> None:
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+    def __enter__(self) -> "JsonlReportWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
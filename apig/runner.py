@@ -0,0 +1,300 @@
+from __future__ import annotations
+
+import asyncio
+import random
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
+from multiprocessing.util import Finalize
+from typing import AsyncIterator, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from apig.agents.base import Agent
+from apig.attacks.schema import AttackSpec
+from apig.env.template import SandboxTemplate
+from apig.env.trace import TraceStore
+from apig.env.types import EpisodeResult, TraceEvent
+from apig.harness import _episode_id, run_task, arun_task
+from apig.suites.base import Task
+from apig.suites.registry import get_suite
+
+
+class DeterminismError(RuntimeError):
+    """A memoized (deterministic) agent produced different results for one variant."""
+
+
+@dataclass(frozen=True)
+class EpisodeOptions:
+    """Harness settings applied to every episode of a run."""
+
+    # Also flag base64/hex/URL-encoded/spaced-out forms of canaries as egress.
+    detect_encoded_canaries: bool = False
+    # Record per-tool call counts and cumulative latency as a "tool_stats" trace event.
+    tool_timing: bool = False
+    # How much of each trace to keep: "full", "summary" (no payloads) or "none".
+    trace_level: str = "full"
+
+
+@dataclass(frozen=True)
+class EpisodeSpec:
+    """Address of one episode in a run.
+
+    Specs only carry indices so they can be shipped to worker processes; tasks
+    (which hold setup closures) are rebuilt on the worker side.
+    """
+
+    suite: str
+    variant: int  # 0 = clean, k = variants[k]
+    task_index: int
+    idx: int
+    task_id: str = ""
+    attacked: bool = False
+    attack_id: Optional[str] = None
+
+    def episode_id(self, seed: int) -> str:
+        return _episode_id(self.suite, self.task_id, self.attacked, seed, self.idx)
+
+    @property
+    def variant_key(self) -> Tuple[str, int, int]:
+        return (self.suite, self.variant, self.task_index)
+
+
+def plan_variants(attack_specs: List[AttackSpec], max_attacks: int) -> List[Optional[AttackSpec]]:
+    """Clean variant followed by the attack sample used for every suite."""
+    if max_attacks == 0:
+        atk_sample: List[AttackSpec] = []
+    elif max_attacks < 0:
+        atk_sample = list(attack_specs)
+    else:
+        atk_sample = attack_specs[:max_attacks] if attack_specs else []
+    return [None] + atk_sample
+
+
+def plan_episodes(suite_names: List[str], variants: List[Optional[AttackSpec]], episodes: int) -> List[EpisodeSpec]:
+    """Enumerate episodes in the canonical (suite, variant, task, episode) order."""
+    specs: List[EpisodeSpec] = []
+    for sn in suite_names:
+        s = get_suite(sn)
+        for vi, atk in enumerate(variants):
+            for ti, task in enumerate(s.tasks(atk)):
+                for i in range(episodes):
+                    specs.append(EpisodeSpec(sn, vi, ti, i, task.task_id, task.attacked, atk.id if atk else None))
+    return specs
+
+
+class EpisodeRunner:
+    """Runs EpisodeSpecs with one agent.
+
+    Each (suite, attack, task) variant is set up once as a SandboxTemplate;
+    every episode gets its own copy-on-write clone of it.
+    """
+
+    def __init__(
+        self,
+        agent: Agent,
+        variants: List[Optional[AttackSpec]],
+        seed: int,
+        options: EpisodeOptions = EpisodeOptions(),
+    ):
+        self.agent = agent
+        self.variants = variants
+        self.seed = seed
+        self.options = options
+        self._tasks: Dict[Tuple[str, int], List[Task]] = {}
+        self._templates: Dict[Tuple[str, int, int], SandboxTemplate] = {}
+
+    def task_for(self, spec: EpisodeSpec) -> Task:
+        k = (spec.suite, spec.variant)
+        if k not in self._tasks:
+            self._tasks[k] = get_suite(spec.suite).tasks(self.variants[spec.variant])
+        return self._tasks[k][spec.task_index]
+
+    def template_for(self, spec: EpisodeSpec) -> SandboxTemplate:
+        k = spec.variant_key
+        if k not in self._templates:
+            self._templates[k] = SandboxTemplate.build(
+                self.task_for(spec), self.variants[spec.variant], self.options.detect_encoded_canaries
+            )
+        return self._templates[k]
+
+    def run(self, spec: EpisodeSpec) -> EpisodeResult:
+        tpl = self.template_for(spec)
+        return run_task(
+            self.agent, self.task_for(spec), tpl.clone(), tpl.canaries, spec.suite, self.seed, spec.idx,
+            expose_inputs=False, scanner=tpl.scanner, tool_timing=self.options.tool_timing,
+            trace_level=self.options.trace_level,
+        )
+
+    async def arun(self, spec: EpisodeSpec) -> EpisodeResult:
+        tpl = self.template_for(spec)
+        return await arun_task(
+            self.agent, self.task_for(spec), tpl.clone(), tpl.canaries, spec.suite, self.seed, spec.idx,
+            expose_inputs=False, scanner=tpl.scanner, tool_timing=self.options.tool_timing,
+            trace_level=self.options.trace_level,
+        )
+
+
+# Per-process runner for pool workers (set by the pool initializer).
+_WORKER: Optional[EpisodeRunner] = None
+
+
+def _init_worker(
+    agent_factory: Callable[[], Agent],
+    variants: List[Optional[AttackSpec]],
+    seed: int,
+    options: EpisodeOptions,
+) -> None:
+    global _WORKER
+    _WORKER = EpisodeRunner(agent_factory(), variants, seed, options)
+    # Pool workers exit without running atexit hooks; Finalize does run.
+    Finalize(_WORKER, _WORKER.agent.close, exitpriority=10)
+
+
+def _run_in_worker(spec: EpisodeSpec) -> EpisodeResult:
+    assert _WORKER is not None, "worker not initialized"
+    return _WORKER.run(spec)
+
+
+async def aiter_episodes(runner: EpisodeRunner, specs: List[EpisodeSpec], concurrency: int) -> AsyncIterator[EpisodeResult]:
+    """Run up to `concurrency` episodes at once, yielding results in spec order.
+
+    Episodes are scheduled a few windows ahead of the consumer so one slow
+    episode does not stall the others.
+    """
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(spec: EpisodeSpec) -> EpisodeResult:
+        async with sem:
+            return await runner.arun(spec)
+
+    it = iter(specs)
+    pending: Deque[asyncio.Task] = deque()
+
+    def refill() -> None:
+        while len(pending) < concurrency * 4:
+            spec = next(it, None)
+            if spec is None:
+                return
+            pending.append(asyncio.ensure_future(one(spec)))
+
+    try:
+        refill()
+        while pending:
+            res = await pending.popleft()
+            refill()
+            yield res
+    finally:
+        for fut in pending:
+            fut.cancel()
+
+
+def run_episodes(
+    specs: List[EpisodeSpec],
+    agent_factory: Callable[[], Agent],
+    variants: List[Optional[AttackSpec]],
+    seed: int,
+    workers: int = 1,
+    concurrency: int = 1,
+    options: EpisodeOptions = EpisodeOptions(),
+) -> Iterator[EpisodeResult]:
+    """Run episodes and yield results in the order of `specs`.
+
+    With `workers > 1` episodes are fanned out over a process pool. Each worker
+    builds its own agent (via `agent_factory`, which must be picklable) and its
+    own sandboxes, so results are identical to a serial run.
+
+    With `concurrency > 1` episodes run in-process on an event loop via
+    Agent.arun, which pays off for agents that wait on LLM round trips.
+    """
+    if workers > 1 and concurrency > 1:
+        raise ValueError("workers and concurrency cannot both be > 1")
+
+    if workers > 1:
+        # Episodes are cheap; batch them to amortize IPC while keeping all workers busy.
+        chunksize = max(1, len(specs) // (workers * 8))
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(agent_factory, variants, seed, options),
+        ) as pool:
+            yield from pool.map(_run_in_worker, specs, chunksize=chunksize)
+        return
+
+    runner = EpisodeRunner(agent_factory(), variants, seed, options)
+    try:
+        if concurrency <= 1:
+            for spec in specs:
+                yield runner.run(spec)
+            return
+
+        loop = asyncio.new_event_loop()
+        agen = aiter_episodes(runner, specs, concurrency)
+        try:
+            while True:
+                try:
+                    res = loop.run_until_complete(agen.__anext__())
+                except StopAsyncIteration:
+                    break
+                yield res
+        finally:
+            loop.run_until_complete(agen.aclose())
+            loop.run_until_complete(runner.agent.aclose())
+            # Finalize async generators left suspended (e.g. cancelled response streams).
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.close()
+    finally:
+        runner.agent.close()
+
+
+def _without_timing(r: EpisodeResult) -> EpisodeResult:
+    """`r` minus its wall-clock measurements (the per-tool latency of a
+    trailing tool_stats event), which differ between identical runs."""
+    if not r.trace or r.trace[-1].kind != "tool_stats":
+        return r
+    last = r.trace[-1]
+    stats = TraceEvent(last.t, last.kind, {name: {"calls": st["calls"]} for name, st in last.data.items()})
+    events = [*r.trace[:-1], stats]
+    return replace(r, trace=TraceStore(events, r.trace.level) if isinstance(r.trace, TraceStore) else events)
+
+
+def memoize_episodes(
+    specs: List[EpisodeSpec],
+    seed: int,
+    run: Callable[[List[EpisodeSpec]], Iterable[EpisodeResult]],
+    verify: int = 0,
+) -> Iterator[EpisodeResult]:
+    """Run each task variant once and replicate it for every episode index.
+
+    Only valid for deterministic agents, where episodes of a variant differ
+    solely in episode_id. `verify` extra episodes per variant (sampled with
+    `seed`) are really executed and must match, else DeterminismError.
+    Timing (EpisodeOptions.tool_timing) is not compared, and replicas carry
+    only the measured episode's call counts, not its latency.
+    """
+    groups: Dict[Tuple[str, int, int], List[EpisodeSpec]] = {}
+    for spec in specs:
+        groups.setdefault(spec.variant_key, []).append(spec)
+
+    rng = random.Random(seed)
+    checks: Dict[Tuple[str, int, int], List[EpisodeSpec]] = {}
+    to_run: List[EpisodeSpec] = []
+    for key, members in groups.items():
+        checks[key] = rng.sample(members[1:], min(verify, len(members) - 1))
+        to_run.append(members[0])
+        to_run.extend(checks[key])
+
+    results = iter(run(to_run))
+    base: Dict[Tuple[str, int, int], EpisodeResult] = {}
+    replica: Dict[Tuple[str, int, int], EpisodeResult] = {}
+    for spec in specs:
+        key = spec.variant_key
+        if key not in base:
+            base[key] = next(results)
+            replica[key] = _without_timing(base[key])
+            for chk in checks[key]:
+                got = _without_timing(next(results))
+                if replace(got, episode_id=base[key].episode_id) != replica[key]:
+                    raise DeterminismError(
+                        f"episode {chk.episode_id(seed)} ({chk.suite}/{chk.task_id}, attack={chk.attack_id}) "
+                        "differs from its memoized variant"
+                    )
+        yield base[key] if spec == groups[key][0] else replace(replica[key], episode_id=spec.episode_id(seed))
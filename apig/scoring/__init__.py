@@ -1 +1,2 @@
-from .metrics import summarize, to_dict, ScoreSummary
+from .metrics import summarize, to_dict, groups_to_dict, ScoreSummary, ScoreAccumulator, GroupedScoreAccumulator, GROUP_KEYS
+from .stats import bootstrap_ci, paired_outcomes, paired_compare, Interval, PairedComparison
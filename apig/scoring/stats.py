@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import math
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Sequence, Set, Tuple, Union
+
+from apig.env.types import EpisodeResult
+from .metrics import N_CELLS, OUTCOME_BITS, ScoreAccumulator, outcome_cell
+
+# Rate metric -> (outcome bit counted, population: None = all episodes,
+# False = clean only, True = attacked only). leak_step_mean is not a rate.
+RATE_METRICS: Dict[str, Tuple[str, Optional[bool]]] = {
+    "CTS": ("success", False),
+    "RTS": ("success", True),
+    "UAR_attempted": ("uar_attempted", None),
+    "UAR_executed": ("uar_executed", None),
+    "SER_attempted": ("ser_attempted", None),
+    "SER_executed": ("ser_executed", None),
+}
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError as e:  # pragma: no cover - depends on the environment
+        raise RuntimeError("Confidence intervals need numpy: pip install 'apig[stats]'") from e
+    return numpy
+
+
+@dataclass
+class Interval:
+    metric: str
+    value: float
+    low: float
+    high: float
+
+
+@dataclass
+class PairedComparison:
+    metric: str
+    pairs: int  # matched episodes in the metric's population
+    a: float
+    b: float
+    diff: float  # b - a
+    low: float
+    high: float
+    only_a: int  # pairs where the outcome holds in A but not in B
+    only_b: int
+    p_value: float  # exact McNemar test on the discordant pairs
+
+
+def _in_population(cell: int, population: Optional[bool]) -> bool:
+    return population is None or bool(cell & 1) == population
+
+
+def _cell_masks(np):
+    """(num, den) 0/1 matrices of shape (N_CELLS, metrics) over outcome cells."""
+    cells = range(N_CELLS)
+    num = np.zeros((N_CELLS, len(RATE_METRICS)), dtype=np.int64)
+    den = np.zeros_like(num)
+    for j, (bit, population) in enumerate(RATE_METRICS.values()):
+        b = 1 << OUTCOME_BITS.index(bit)
+        for c in cells:
+            if _in_population(c, population):
+                den[c, j] = 1
+                num[c, j] = bool(c & b)
+    return num, den
+
+
+def _rates(np, num, den):
+    return np.divide(num, den, out=np.zeros(num.shape, dtype=float), where=den > 0)
+
+
+def bootstrap_ci(
+    scores: Union[ScoreAccumulator, Sequence[int]],
+    n_boot: int = 10_000,
+    alpha: float = 0.05,
+    seed: int = 0,
+) -> Dict[str, Interval]:
+    """Percentile bootstrap CIs for every rate metric.
+
+    Resampling N episodes with replacement only changes how many episodes fall
+    in each joint outcome cell, so each resample is one multinomial draw over
+    the accumulator's `cells`: the cost is O(n_boot * cells), independent of
+    the number of episodes.
+    """
+    np = _numpy()
+    counts = np.asarray(scores.cells if isinstance(scores, ScoreAccumulator) else scores, dtype=np.int64)
+    num_mask, den_mask = _cell_masks(np)
+    point = _rates(np, counts @ num_mask, counts @ den_mask)
+    n = int(counts.sum())
+    if n == 0:
+        draws = np.zeros((1, N_CELLS), dtype=np.int64)
+    else:
+        draws = np.random.default_rng(seed).multinomial(n, counts / n, size=n_boot)
+    rates = _rates(np, draws @ num_mask, draws @ den_mask)
+    low, high = np.quantile(rates, [alpha / 2, 1 - alpha / 2], axis=0)
+    return {
+        m: Interval(m, float(point[j]), float(low[j]), float(high[j]))
+        for j, m in enumerate(RATE_METRICS)
+    }
+
+
+def mcnemar_exact(only_a: int, only_b: int) -> float:
+    """Two-sided exact McNemar p-value (binomial test on the discordant pairs)."""
+    np = _numpy()
+    n = only_a + only_b
+    if n == 0:
+        return 1.0
+    k = min(only_a, only_b)
+    i = np.arange(1, k + 1, dtype=float)
+    # log C(n, j) for j = 0..k, then log P(X <= k) for X ~ Binomial(n, 1/2)
+    log_comb = np.concatenate(([0.0], np.cumsum(np.log(n - i + 1) - np.log(i))))
+    log_p = log_comb - n * math.log(2)
+    top = log_p.max()
+    tail = math.exp(top) * float(np.exp(log_p - top).sum())
+    return min(1.0, 2 * tail)
+
+
+def paired_outcomes(a: Iterable[EpisodeResult], b: Iterable[EpisodeResult]) -> Tuple[Counter, int, int]:
+    """Joint (cell in A, cell in B) counts over episodes matched on (episode_id, attack_id).
+
+    Returns (counts, unmatched in A, unmatched in B). `b` is streamed.
+    Raises ValueError if either side repeats a key, as reports written before
+    attack_id was recorded do (all attack variants of a task share an
+    episode_id there), since such episodes cannot be paired.
+    """
+    cells_a: Dict[Tuple[str, Optional[str]], int] = {}
+    dup_a = 0
+    for r in a:
+        key = (r.episode_id, r.attack_id)
+        if key in cells_a:
+            dup_a += 1
+        else:
+            cells_a[key] = outcome_cell(r)
+    if dup_a:
+        raise ValueError(_duplicate_keys("A", dup_a))
+    joint: Counter = Counter()
+    seen_b: Set[Tuple[str, Optional[str]]] = set()
+    dup_b = unmatched_b = 0
+    for r in b:
+        key = (r.episode_id, r.attack_id)
+        if key in seen_b:
+            dup_b += 1
+            continue
+        seen_b.add(key)
+        ca = cells_a.pop(key, None)
+        if ca is None:
+            unmatched_b += 1
+        else:
+            joint[(ca, outcome_cell(r))] += 1
+    if dup_b:
+        raise ValueError(_duplicate_keys("B", dup_b))
+    return joint, len(cells_a), unmatched_b
+
+
+def _duplicate_keys(side: str, n: int) -> str:
+    return (
+        f"{side} has {n} episodes repeating an (episode_id, attack_id) key; "
+        "the report probably lacks attack_id (written before it was recorded), cannot pair"
+    )
+
+
+def paired_compare(
+    joint: Counter,
+    n_boot: int = 10_000,
+    alpha: float = 0.05,
+    seed: int = 0,
+) -> Dict[str, PairedComparison]:
+    """Per-metric paired comparison of two runs (B - A) from paired_outcomes().
+
+    The CI of the difference is a paired bootstrap: pairs are resampled as
+    units, again as multinomial draws over the (in A, in B) outcome cells.
+    """
+    np = _numpy()
+    rng = np.random.default_rng(seed)
+    total = sum(joint.values())
+    out: Dict[str, PairedComparison] = {}
+    for metric, (bit, population) in RATE_METRICS.items():
+        b = 1 << OUTCOME_BITS.index(bit)
+        # cells: [neither, A only, B only, both, outside the population]
+        counts = np.zeros(5, dtype=np.int64)
+        for (ca, cb), n in joint.items():
+            if not _in_population(ca, population):
+                counts[4] += n
+            else:
+                counts[bool(ca & b) | bool(cb & b) << 1] += n
+        pairs = int(counts[:4].sum())
+        a_rate = (counts[1] + counts[3]) / pairs if pairs else 0.0
+        b_rate = (counts[2] + counts[3]) / pairs if pairs else 0.0
+        if pairs:
+            draws = rng.multinomial(total, counts / total, size=n_boot)
+            diffs = _rates(np, draws[:, 2] - draws[:, 1], draws[:, :4].sum(axis=1))
+            low, high = np.quantile(diffs, [alpha / 2, 1 - alpha / 2])
+        else:
+            low = high = 0.0
+        out[metric] = PairedComparison(
+            metric=metric,
+            pairs=pairs,
+            a=float(a_rate),
+            b=float(b_rate),
+            diff=float(b_rate - a_rate),
+            low=float(low),
+            high=float(high),
+            only_a=int(counts[1]),
+            only_b=int(counts[2]),
+            p_value=mcnemar_exact(int(counts[1]), int(counts[2])),
+        )
+    return out
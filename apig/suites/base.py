@@ -1,7 +1,7 @@
 from __future__ import annotations
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Callable, Dict, List, Optional, Any
-from apig.env.tools import SandboxState
+from apig.env.tools import SandboxState, ToolSpec
 from apig.env.policy import Policy
 from apig.attacks.schema import AttackSpec
 
@@ -14,6 +14,8 @@ class Task:
     policy: Policy
     attacked: bool = False
     attack: Optional[AttackSpec] = None
+    # Extra tools available in this task's sandbox (on top of apig.env.tools.TOOLS).
+    tools: List[ToolSpec] = field(default_factory=list)
 
 class Suite:
     name: str
@@ -0,0 +1,527 @@
+import asyncio
+import json
+from dataclasses import replace
+
+from apig.agents.llm_agent import LLMDrivenAgent, LLMConfig
+from apig.llm.providers.base import LLMProvider, LLMRequest, LLMResponse
+from apig.env.types import ToolCall, TraceEvent
+from apig.runner import plan_variants, plan_episodes, run_episodes
+
+
+class ScriptedProvider(LLMProvider):
+    """Reads the inbox once, then answers. Tracks peak in-flight async calls."""
+
+    name = "scripted"
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.in_flight = 0
+        self.peak = 0
+
+    def generate(self, req: LLMRequest) -> LLMResponse:
+        if "You are at step 0." in req.user_prompt:
+            action = {"type": "tool", "name": "read_file", "args": {"path": "/sandbox/inbox_latest.txt"}}
+        else:
+            action = {"type": "final", "answer": "Summary: benefits update"}
+        return LLMResponse(text=json.dumps(action), raw={})
+
+    async def agenerate(self, req: LLMRequest) -> LLMResponse:
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        await asyncio.sleep(self.delay)
+        self.in_flight -= 1
+        return self.generate(req)
+
+
+def _agent(provider, max_concurrency=None, coalesce=True):
+    cfg = LLMConfig(provider="openai", model="stub", api_key="test", max_concurrency=max_concurrency, coalesce=coalesce)
+    return LLMDrivenAgent(name="llm_naive", config=cfg, defended=False, provider=provider)
+
+
+def _as_paid(results):
+    """Results without the marks of unpaid (replayed/coalesced) steps, to
+    compare them with a run that called the provider every step."""
+    def strip(e):
+        return TraceEvent(e.t, e.kind, {k: v for k, v in e.data.items() if k != "source"})
+
+    return [replace(r, trace=[strip(e) for e in r.trace], llm_usage={}) for r in results]
+
+
+def test_async_run_matches_sync_run_and_respects_limit():
+    provider = ScriptedProvider(delay=0.01)
+    variants = plan_variants([], 0)
+    specs = plan_episodes(["inbox"], variants, 12)
+    serial = list(run_episodes(specs, lambda: _agent(provider), variants, 0))
+    concurrent = list(
+        run_episodes(specs, lambda: _agent(provider, max_concurrency=3, coalesce=False), variants, 0, concurrency=8)
+    )
+    assert serial == concurrent
+    assert [r.episode_id for r in serial] == [r.episode_id for r in concurrent]
+    assert provider.peak == 3
+
+
+def test_concurrent_identical_requests_are_coalesced():
+    class Counting(ScriptedProvider):
+        calls = 0
+
+        async def agenerate(self, req):
+            self.calls += 1
+            return await super().agenerate(req)
+
+    provider = Counting(delay=0.01)
+    variants = plan_variants([], 0)
+    specs = plan_episodes(["inbox"], variants, 12)
+    serial = list(run_episodes(specs, lambda: _agent(ScriptedProvider()), variants, 0))
+    agents = []
+
+    def factory():
+        agents.append(_agent(provider))
+        return agents[-1]
+
+    concurrent = list(run_episodes(specs, factory, variants, 0, concurrency=12))
+    assert _as_paid(serial) == _as_paid(concurrent)
+    # 12 episodes x 2 identical steps, run in lockstep: one provider call per step.
+    assert provider.calls == 2
+    assert agents[0]._flights.shared == 22
+    assert sum(r.llm_usage["calls"] for r in concurrent) == 2
+    assert sum(r.llm_usage.get("coalesced", 0) for r in concurrent) == 22
+
+
+def test_coalesced_waiters_survive_a_cancelled_leader():
+    import pytest
+    from apig.llm.singleflight import SingleFlight
+
+    flights = SingleFlight()
+    started = []
+
+    async def fn():
+        started.append(len(started))
+        await asyncio.sleep(0.01)
+        return f"call {len(started)}"
+
+    async def go():
+        leader = asyncio.create_task(flights.do("k", fn))
+        await asyncio.sleep(0)
+        waiters = [asyncio.create_task(flights.do("k", fn)) for _ in range(3)]
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.gather(*waiters)
+
+    # One waiter re-issues the call; the others share it.
+    assert asyncio.run(go()) == ["call 2"] * 3
+    assert (flights.calls, flights.shared) == (2, 2)
+
+
+def test_llm_cache_write_behind_is_visible_and_shared(tmp_path):
+    from pathlib import Path
+    from apig.llm.cache import LLMCache
+
+    path = Path(tmp_path / "cache.sqlite")
+    a, b = LLMCache(path, batch_size=8), LLMCache(path, batch_size=8)
+    for i in range(50):
+        (a if i % 2 else b).set(f"k{i}", {"text": str(i)})
+    # Queued writes are readable right away by their writer...
+    assert a.get("k1") == {"text": "1"} and b.get("k0") == {"text": "0"}
+    a.flush()
+    b.flush()
+    # ...and by other connections once flushed.
+    assert a.get("k0") == {"text": "0"} and b.get("k49") == {"text": "49"}
+    a.close()
+    b.close()
+    c = LLMCache(path)
+    assert c._conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert all(c.get(f"k{i}") == {"text": str(i)} for i in range(50))
+    c.close()
+
+
+def test_llm_cache_tiers_compression_and_gc(tmp_path):
+    import sqlite3
+    from pathlib import Path
+    from apig.llm.cache import LLMCache
+
+    path = Path(tmp_path / "cache.sqlite")
+    legacy = sqlite3.connect(str(path))
+    legacy.execute("CREATE TABLE llm_cache (k TEXT PRIMARY KEY, v TEXT NOT NULL)")
+    legacy.execute("INSERT INTO llm_cache VALUES ('old', ?)", (json.dumps({"text": "hi", "raw": {}}),))
+    legacy.commit()
+    legacy.close()
+
+    cache = LLMCache(path, memory_bytes=200, keep_raw=False)
+    assert cache.get("old") == {"text": "hi", "raw": {}}  # legacy row still readable
+    for i in range(20):
+        cache.set(f"k{i}", {"text": "a" * 1000, "raw": {"usage": {"total_tokens": i}, "choices": ["..."]}})
+    assert cache.get("k19") == {"text": "a" * 1000, "usage": {"total_tokens": 19}}
+    # The memory tier is budgeted by decoded size: only the legacy row fits.
+    assert len(cache._memory) == 1
+    assert cache._memory.bytes == len(json.dumps({"text": "hi", "raw": {}}))
+    stats = cache.stats()
+    assert stats["entries"] == 21 and stats["legacy_entries"] == 1
+    assert stats["stored_bytes"] < 20 * 1000  # compressed
+
+    assert cache.gc(max_bytes=stats["stored_bytes"] - 1) >= 1
+    assert cache.get("old") is None  # oldest first
+    assert cache.gc(ttl_seconds=-1) == 20
+    cache.vacuum()
+    cache.close()
+
+
+def test_llm_cache_commit_failure_surfaces_instead_of_hanging(tmp_path):
+    import sqlite3
+    import pytest
+    from pathlib import Path
+    from apig.llm.cache import LLMCache
+
+    class Failing(LLMCache):
+        def _commit(self, conn, batch):
+            raise sqlite3.OperationalError("database is locked")
+
+    cache = Failing(Path(tmp_path / "cache.sqlite"), flush_interval=0.01)
+    cache.set("k0", {"text": "0"})
+    with pytest.raises(sqlite3.OperationalError):
+        cache.flush()
+    with pytest.raises(sqlite3.OperationalError):
+        cache.stats()
+    with pytest.raises(sqlite3.OperationalError):
+        cache.set("k1", {"text": "1"})
+    assert cache.get("k0") == {"text": "0"}  # still served from memory
+    with pytest.raises(sqlite3.OperationalError):
+        cache.close()
+
+
+def test_openai_client_reuses_pooled_connections():
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from apig.llm.providers.openai_client import OpenAIClient
+
+    peers = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            peers.append((self.path, self.client_address))
+            body = json.dumps({"choices": [{"message": {"content": "ok"}}]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        client = OpenAIClient(api_key="test", base_url=f"http://127.0.0.1:{server.server_port}/v1")
+        req = LLMRequest(provider="openai", model="stub", system_prompt="s", user_prompt="u")
+        assert [client.generate(req).text for _ in range(3)] == ["ok"] * 3
+
+        async def go():
+            out = [(await client.agenerate(req)).text for _ in range(3)]
+            await client.aclose()
+            return out
+
+        assert asyncio.run(go()) == ["ok"] * 3
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert {p for p, _ in peers} == {"/v1/chat/completions"}
+    # One keep-alive connection for the sync client, one for the async client.
+    assert len({addr for _, addr in peers}) == 2
+
+
+def test_rate_limited_provider_retries_throttling_and_adapts():
+    import pytest
+    from apig.llm.limits import ConcurrencyLimiter, RetryPolicy, TokenBucket
+    from apig.llm.providers.base import LLMProviderError, parse_retry_after
+    from apig.llm.providers.ratelimited import RateLimitedProvider
+
+    class Flaky(LLMProvider):
+        name = "flaky"
+
+        def __init__(self, failures):
+            self.failures = list(failures)
+
+        def generate(self, req):
+            if self.failures:
+                raise self.failures.pop(0)
+            return LLMResponse(text="ok", raw={}, usage={"total_tokens": 10})
+
+    req = LLMRequest(provider="flaky", model="m", system_prompt="s", user_prompt="u")
+    slept = []
+    limiter = ConcurrencyLimiter(8)
+    throttle = LLMProviderError("HTTP 429", status_code=429, retry_after=2.0)
+    p = RateLimitedProvider(
+        Flaky([throttle, LLMProviderError("HTTP 502", status_code=502)]),
+        retry=RetryPolicy(max_retries=3, base_delay_s=0.1),
+        limiter=limiter,
+        sleep=slept.append,
+    )
+    assert p.generate(req).text == "ok"
+    assert slept[0] == 2.0 and 0 <= slept[1] <= 0.2  # Retry-After, then jittered backoff
+    assert (p.retries, p.throttled) == (2, 1)
+    assert 4 < limiter.current < 5  # halved, then one additive step back up
+
+    # Async attempts hold a limiter slot only while calling, not while backing off.
+    class AFlaky(Flaky):
+        async def agenerate(self, req):
+            held.append(limiter._in_flight)
+            return self.generate(req)
+
+    async def asleep(delay):
+        held.append(limiter._in_flight)
+
+    held = []
+    limiter = ConcurrencyLimiter(1)
+    p = RateLimitedProvider(AFlaky([throttle]), limiter=limiter, asleep=asleep)
+    assert asyncio.run(p.agenerate(req)).text == "ok"
+    assert held == [1, 0, 1]
+
+    with pytest.raises(LLMProviderError):  # client errors are not retried
+        RateLimitedProvider(Flaky([LLMProviderError("HTTP 400", status_code=400)]), sleep=slept.append).generate(req)
+    with pytest.raises(LLMProviderError):  # nor are retries unbounded
+        RateLimitedProvider(Flaky([throttle] * 3), retry=RetryPolicy(max_retries=2), sleep=slept.append).generate(req)
+
+    now = [0.0]
+    bucket = TokenBucket(60, burst=2, clock=lambda: now[0])
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 1.0]
+    now[0] = 3.0
+    assert bucket.reserve() == 0.0
+    assert parse_retry_after("7") == 7.0 and parse_retry_after("soon") is None
+
+
+def test_recorded_transcript_replays_offline(tmp_path):
+    import pytest
+    from apig.llm.providers.replay import RecordingProvider, ReplayProvider, parse_latency
+
+    variants = plan_variants([], 0)
+    specs = plan_episodes(["inbox"], variants, 3)
+    transcript = str(tmp_path / "llm.jsonl")
+    recorded = list(run_episodes(specs, lambda: _agent(RecordingProvider(ScriptedProvider(), transcript)), variants, 0))
+
+    def replay_agent(**options):
+        cfg = LLMConfig(provider="replay", model="stub", provider_options=dict(recorded_as="openai", **options))
+        return LLMDrivenAgent(name="llm_naive", config=cfg, defended=False)
+
+    replayed = list(run_episodes(specs, lambda: replay_agent(transcript=transcript), variants, 0, concurrency=3))
+    assert _as_paid(replayed) == _as_paid(recorded)
+    assert all(r.llm_usage["calls"] == 0 and r.llm_usage["replayed"] == 2 for r in replayed)
+
+    strict = ReplayProvider(transcript=transcript)  # keys differ when not replayed "as openai"
+    req = LLMRequest(provider="openai", model="other", system_prompt="s", user_prompt="Task: /sandbox/a.txt\nYou are at step 0.")
+    with pytest.raises(Exception, match="Replay miss"):
+        strict.generate(req)
+    lenient = ReplayProvider(transcript=transcript, strict=False)
+    assert json.loads(lenient.generate(req).text)["args"] == {"path": "/sandbox/a.txt"}
+    assert parse_latency("fixed:0.25")() == 0.25
+    with pytest.raises(ValueError):
+        parse_latency("gamma:1")
+
+
+def test_stub_server_load_test_with_throttling():
+    from apig.llm.providers.gemini_client import GeminiClient
+    from apig.llm.stub_server import StubProfile, StubServer
+    from apig.loadtest import percentile, run_loadtest
+
+    profile = StubProfile(latency="fixed:0.01", throttle_rate=0.3, retry_after=0.01, seed=1)
+    with StubServer(profile=profile) as server:
+        res = run_loadtest(server.url + "/v1", suites=["inbox"], episodes=4, concurrency=8)
+        stats = dict(server.stats)
+        # Streamed responses carry no server time: no overhead figure.
+        streamed = run_loadtest(server.url + "/v1", suites=["inbox"], episodes=2, concurrency=4, stream=True).to_dict()
+        gemini = GeminiClient(api_key="k", base_url=server.url + "/v1beta")
+        req = LLMRequest(provider="gemini", model="m", system_prompt="", user_prompt="You are at step 1.")
+        for _ in range(5):  # throttled calls surface as retryable 429s
+            try:
+                resp = gemini.generate(req)
+                break
+            except Exception as e:
+                assert e.status_code == 429 and e.retry_after == 0.01
+        gemini.close()
+    summary = res.to_dict()
+    # Every step eventually succeeded; each 429 was retried once.
+    assert summary["requests"] == stats["ok"] == 2 * res.episodes
+    assert res.throttled == stats["throttled"] > 0
+    assert 0 < summary["step_p50_ms"] <= summary["step_p95_ms"] <= summary["step_p99_ms"]
+    assert summary["client_overhead_mean_ms"] >= 0 and "client_overhead_mean_ms" not in streamed
+    assert json.loads(resp.text)["type"] == "final"
+    assert resp.raw["stub"]["server_ms"] >= 10
+    assert percentile([1.0, 2.0, 3.0, 4.0], 50) == 2.0 and percentile([], 99) == 0.0
+
+
+def test_llm_usage_is_accounted_per_step_episode_and_run(tmp_path):
+    from apig.llm.accounting import model_price, step_cost
+    from apig.report import episode_from_dict, episode_to_dict
+    from apig.scoring import summarize, to_dict
+
+    class Metered(ScriptedProvider):
+        def generate(self, req):
+            resp = super().generate(req)
+            return LLMResponse(text=resp.text, raw={}, usage={"prompt_tokens": 1000, "completion_tokens": 100})
+
+    cfg = LLMConfig(provider="openai", model="gpt-4.1-mini-2025-04-14", api_key="test", cache_path=str(tmp_path / "c.sqlite"), timing=True)
+    agent = LLMDrivenAgent(name="llm_naive", config=cfg, defended=False)
+    agent._provider = Metered()
+    variants = plan_variants([], 0)
+    specs = plan_episodes(["inbox"], variants, 2)
+    first, second = list(run_episodes(specs, lambda: agent, variants, 0))
+
+    step = next(e for e in first.trace if e.kind == "llm_response").data
+    assert (step["prompt_tokens"], step["completion_tokens"]) == (1000, 100) and step["latency_ms"] >= 0
+    assert step["cost_usd"] == step_cost("gpt-4.1-mini", 1000, 100) == (1000 * 0.40 + 100 * 1.60) / 1e6
+    assert first.llm_usage["calls"] == 2 and first.llm_usage["cache_hits"] == 0
+    # The second episode is served from the cache: tokens are known, nothing is spent.
+    assert second.llm_usage["cache_hits"] == 2 and second.llm_usage["calls"] == 0
+    assert second.llm_usage["prompt_tokens"] == 2000 and "cost_usd" not in second.llm_usage
+    assert episode_from_dict(episode_to_dict(first)).llm_usage == first.llm_usage
+
+    usage = to_dict(summarize([first, second]))["llm_usage"]
+    assert usage["prompt_tokens_per_episode"] == 2000 and usage["cost_usd"] == first.llm_usage["cost_usd"]
+    assert usage["latency_ms_per_call"] == first.llm_usage["latency_ms"] / 2
+    assert model_price("claude-unknown") is None
+
+    # Coalesced steps share one paid call: counted apart, not costed again.
+    metered = Metered(delay=0.01)
+    cfg = LLMConfig(provider="openai", model="gpt-4.1-mini", api_key="test")
+    specs = plan_episodes(["inbox"], variants, 12)
+    results = list(run_episodes(specs, lambda: LLMDrivenAgent("llm_naive", cfg, False, provider=metered), variants, 0, concurrency=12))
+    usage = summarize(results).llm_usage
+    assert (usage["calls"], usage["coalesced"]) == (2, 22)
+    assert usage["cost_usd"] == 2 * step_cost("gpt-4.1-mini", 1000, 100)
+    assert usage["prompt_tokens"] == 24 * 1000
+    coalesced = next(e for r in results for e in r.trace if e.data.get("source") == "coalesced").data
+    assert "cost_usd" not in coalesced and coalesced["prompt_tokens"] == 1000
+
+
+def test_multi_turn_conversation_keeps_a_stable_prefix():
+    from apig.llm.cache import request_key
+    from apig.llm.providers.base import MessageLog
+    from apig.llm.providers.openai_client import OpenAIClient
+    from apig.llm.stub_server import StubServer
+
+    class Capturing(LLMProvider):
+        name = "capturing"
+
+        def __init__(self, inner):
+            self.inner = inner
+            self.requests = []
+
+        def generate(self, req):
+            self.requests.append(req)
+            return self.inner.generate(req)
+
+    variants = plan_variants([], 0)
+    specs = plan_episodes(["inbox"], variants, 2)
+    with StubServer() as server:
+        provider = Capturing(OpenAIClient(api_key="stub", base_url=server.url + "/v1"))
+        cfg = LLMConfig(provider="openai", model="stub", multi_turn=True)
+        agent = LLMDrivenAgent(name="llm_naive", config=cfg, defended=False, provider=provider)
+        results = list(run_episodes(specs, lambda: agent, variants, 0))
+
+    assert [r.llm_usage["calls"] for r in results] == [2, 2]
+    first, second = provider.requests[:2]
+    assert [m["role"] for m in second.messages] == ["user", "assistant", "user"]
+    assert second.messages[:1] == first.messages and second.user_prompt == second.messages[-1]["content"]
+    assert second.messages.digest == MessageLog.of(second.messages).digest
+    # Same conversation in the next episode -> same key; single-turn keys differ.
+    assert request_key(provider.requests[2]) == request_key(first)
+    assert request_key(first) != request_key(LLMRequest(**{**first.__dict__, "messages": None}))
+    steps = [e.data for r in results for e in r.trace if e.kind == "llm_response"]
+    assert "cached_prompt_tokens" not in steps[0] and steps[1]["cached_prompt_tokens"] > 0
+
+
+def test_streaming_stops_once_the_action_json_is_complete():
+    from apig.agents.llm_agent import JSONObjectScanner
+    from apig.llm.providers.gemini_client import GeminiClient
+    from apig.llm.providers.openai_client import OpenAIClient
+    from apig.llm.stub_server import StubProfile, StubServer
+
+    scanner = JSONObjectScanner()
+    pieces = ['Sure: {not json} then ```json\n{"type":"final","ans', 'wer":"a \\"}\\" {b}"}', "``` and more {"]
+    ends = [scanner.feed(p) for p in pieces]
+    assert ends[:2] == [None, len(pieces[0] + pieces[1])] and ends[2] == ends[1]
+    assert scanner.value == {"type": "final", "answer": 'a "}" {b}'}
+
+    variants = plan_variants([], 0)
+    specs = plan_episodes(["inbox"], variants, 2)
+    profile = StubProfile(ramble_chars=2000, stream_piece_s=0.002)
+    with StubServer(profile=profile) as server:
+        clients = {
+            "openai": lambda: OpenAIClient(api_key="stub", base_url=server.url + "/v1"),
+            "gemini": lambda: GeminiClient(api_key="stub", base_url=server.url + "/v1beta"),
+        }
+        for name, make in clients.items():
+            for concurrency in (1, 2):
+                cfg = LLMConfig(provider=name, model="stub", stream=True)
+                agent = LLMDrivenAgent(name="llm_naive", config=cfg, defended=False, provider=make())
+                results = list(run_episodes(specs, lambda: agent, variants, 0, concurrency=concurrency))
+                steps = [e.data for r in results for e in r.trace if e.kind == "llm_response"]
+                assert len(steps) == 4 and all(s["text"].endswith("}") for s in steps)
+                assert results[0].trace[-3].data["answer"] == "Done."
+                # Usage is estimated from what was read, not the 2000-char ramble.
+                assert all(s["completion_tokens"] < 30 for s in steps)
+        cancelled = server.stats["cancelled"]
+    assert cancelled > 0
+
+
+def test_batched_tool_calls_respect_order_and_budget():
+    from apig.agents.base import ToolInterface
+    from apig.env.types import ToolResult
+
+    class Batching(LLMProvider):
+        name = "batching"
+
+        def generate(self, req):
+            if "You are at step 0." in req.user_prompt:
+                calls = [
+                    {"name": "read_file", "args": {"path": "/sandbox/inbox_latest.txt"}},
+                    {"name": "read_file", "args": {"path": "/sandbox/context.txt"}},
+                    {"name": "write_file", "args": {"path": "/sandbox/notes.txt", "content": "x"}},
+                    {"name": "read_file", "args": {"path": "/sandbox/notes.txt"}},
+                ]
+                return LLMResponse(text=json.dumps({"type": "tools", "calls": calls}), raw={})
+            return LLMResponse(text=json.dumps({"type": "final", "answer": "Summary: benefits update"}), raw={})
+
+    def agent():
+        cfg = LLMConfig(provider="openai", model="stub", api_key="test", batch_tools=True, coalesce=False)
+        a = LLMDrivenAgent(name="llm_naive", config=cfg, defended=False, max_tool_calls=3)
+        a._provider = Batching()
+        return a
+
+    assert '"type":"tools"' in agent()._system_prompt()
+    variants = plan_variants([], 0)
+    specs = plan_episodes(["inbox"], variants, 2)
+    serial = list(run_episodes(specs, agent, variants, 0))
+    assert list(run_episodes(specs, agent, variants, 0, concurrency=2)) == serial
+    calls = [e.data["name"] for e in serial[0].trace if e.kind == "tool_call"]
+    # Three calls fit the budget; the fourth is dropped, then the final answer is written.
+    assert calls == ["read_file", "read_file", "write_file", "write_file"]
+    assert serial[0].files_written.get("/sandbox/notes.txt") == 1
+
+    class Recording(ToolInterface):
+        def __init__(self):
+            self.log = []
+
+        def call(self, call):
+            raise AssertionError("async path only")
+
+        async def acall(self, call):
+            self.log.append(("start", call.name))
+            await asyncio.sleep(0.01 if call.name == "slow_read" else 0)
+            self.log.append(("end", call.name))
+            return ToolResult(True, call.name)
+
+        def is_read_only(self, name):
+            return name.endswith("read")
+
+    tools = Recording()
+    batch = [ToolCall(n, {}) for n in ("slow_read", "read", "write", "read")]
+    results = asyncio.run(tools.acall_batch(batch))
+    assert [r.content for r in results] == ["slow_read", "read", "write", "read"]
+    # The two leading reads overlap; the write waits for both.
+    assert tools.log[:4] == [("start", "slow_read"), ("start", "read"), ("end", "read"), ("end", "slow_read")]
+    assert tools.log[4:] == [("start", "write"), ("end", "write"), ("start", "read"), ("end", "read")]
@@ -0,0 +1,158 @@
+import json
+from functools import partial
+
+from apig.agents.registry import get_agent
+from apig.report import JsonlReportWriter
+from apig.runner import plan_variants, plan_episodes, run_episodes
+from apig.scoring import ScoreAccumulator, to_dict
+
+
+def test_jsonl_report_streams_episodes_then_summary(tmp_path):
+    variants = plan_variants([], 0)
+    specs = plan_episodes(["inbox", "rag_policy"], variants, 2)
+    acc = ScoreAccumulator()
+    out = tmp_path / "r.jsonl"
+    with JsonlReportWriter(str(out)) as w:
+        for r in run_episodes(specs, partial(get_agent, "rule"), variants, 0):
+            acc.add(r)
+            w.write_episode(r)
+        w.write_summary(to_dict(acc.summary()))
+    lines = [json.loads(x) for x in out.read_text().splitlines()]
+    assert [x["type"] for x in lines] == ["episode"] * 4 + ["summary"]
+    assert lines[-1]["summary"]["episodes"] == 4
+    assert lines[-1]["summary"]["CTS"] == 1.0
+
+
+def test_resume_skips_journaled_episodes(tmp_path):
+    import pytest
+    from itertools import islice
+    from apig.journal import RunJournal, resume_episodes
+
+    variants = plan_variants([], 0)
+    specs = plan_episodes(["inbox", "web_form"], variants, 3)
+    factory = partial(get_agent, "rule")
+    ran = []
+
+    def run(todo):
+        ran.append(len(todo))
+        return run_episodes(todo, factory, variants, 0)
+
+    path = str(tmp_path / "run.journal")
+    with RunJournal(path, batch_size=2) as j:
+        list(islice(resume_episodes(specs, 0, "rule", j, run), 4))  # "crash" after 4 episodes
+    with RunJournal(path) as j:
+        assert len(j.completed) == 4
+        resumed = list(resume_episodes(specs, 0, "rule", j, run))
+    assert ran == [6, 2]
+    assert [r.episode_id for r in resumed] == [s.episode_id(0) for s in specs]
+    assert resumed == list(run_episodes(specs, factory, variants, 0))
+
+    # Journals record the run settings and refuse to resume under others.
+    path = str(tmp_path / "settings.journal")
+    with RunJournal(path, settings={"trace_level": "full", "max_steps": 8}) as j:
+        list(islice(resume_episodes(specs, 0, "rule", j, run), 2))
+    with RunJournal(path, settings={"trace_level": "full", "max_steps": 8}) as j:
+        assert len(j.completed) == 2
+    with pytest.raises(ValueError, match="max_steps=8, not max_steps=4"):
+        RunJournal(path, settings={"trace_level": "full", "max_steps": 4})
+    with pytest.raises(ValueError, match="does not record its run settings"):
+        RunJournal(str(tmp_path / "run.journal"), settings={"trace_level": "full"})
+
+
+def test_trace_archive_dedupes_and_reads_single_episodes(tmp_path):
+    from apig.archive import TraceArchive, TraceArchiveWriter
+
+    variants = plan_variants([], 0)
+    specs = plan_episodes(["inbox", "web_form"], variants, 3)
+    results = list(run_episodes(specs, partial(get_agent, "rule"), variants, 0))
+    root = str(tmp_path / "traces")
+    with TraceArchiveWriter(root) as w:
+        for r in results[:4]:
+            w.add(r)
+    with TraceArchiveWriter(root) as w:  # reopening appends
+        for r in results[4:]:
+            w.add(r)
+
+    with TraceArchive(root) as ta:
+        assert len(ta.index) == 6
+        for r in results:
+            assert ta.get(r.episode_id, r.attack_id) == list(r.trace)
+        # Episodes of a deterministic agent repeat; each distinct trace is stored once.
+        assert len({e[0]["digest"] for e in ta.index.values()}) == 2
+
+
+def test_grouped_scores_match_per_group_summaries_and_rescoring(tmp_path):
+    from apig.attacks.io import load_attack_file
+    from apig.report import iter_report_episodes
+    from apig.scoring import GroupedScoreAccumulator, summarize
+    from pathlib import Path
+
+    attacks = load_attack_file(str(Path(__file__).resolve().parent.parent / "attacks" / "example.yml"))
+    variants = plan_variants(attacks, -1)
+    specs = plan_episodes(["inbox", "web_form"], variants, 2)
+    results = list(run_episodes(specs, partial(get_agent, "naive"), variants, 0))
+    acc = GroupedScoreAccumulator(["suite", "stealth"])
+    out = tmp_path / "r.jsonl"
+    with JsonlReportWriter(str(out)) as w:
+        for r in results:
+            acc.add(r)
+            w.write_episode(r)
+    assert acc.summary() == summarize(results)
+    by_suite = acc.group_summaries("suite")["suite"]
+    assert by_suite["inbox"] == summarize(r for r in results if r.suite == "inbox")
+    assert acc.group_summaries()["stealth"]["clean"].attacked_episodes == 0
+
+    rescored = GroupedScoreAccumulator(["stealth"])
+    for r in iter_report_episodes(str(out)):
+        assert r.trace == []
+        rescored.add(r)
+    assert rescored.group_summaries() == acc.group_summaries("stealth")
+
+
+def test_bootstrap_ci_and_paired_compare(tmp_path):
+    import pytest
+
+    pytest.importorskip("numpy")
+    from apig.attacks.io import load_attack_file
+    from apig.scoring import bootstrap_ci, paired_compare, paired_outcomes
+    from apig.scoring.stats import mcnemar_exact
+    from pathlib import Path
+
+    attacks = load_attack_file(str(Path(__file__).resolve().parent.parent / "attacks" / "example.yml"))
+    variants = plan_variants(attacks, -1)
+    specs = plan_episodes(["inbox", "rag_policy", "web_form"], variants, 5)
+    naive = list(run_episodes(specs, partial(get_agent, "naive"), variants, 0))
+    rule = list(run_episodes(specs, partial(get_agent, "rule"), variants, 0))
+
+    acc = ScoreAccumulator()
+    for r in naive:
+        acc.add(r)
+    cis = bootstrap_ci(acc, n_boot=2000)
+    summary = to_dict(acc.summary())
+    for m, iv in cis.items():
+        assert iv.value == pytest.approx(summary[m])
+        assert iv.low <= iv.value <= iv.high
+
+    joint, only_a, only_b = paired_outcomes(naive, rule[:-3])
+    assert (only_a, only_b) == (3, 0)
+    cmp = paired_compare(joint, n_boot=2000)
+    assert cmp["RTS"].b == 1.0 and cmp["RTS"].only_a == 0 and cmp["RTS"].p_value < 0.01
+    assert cmp["RTS"].low <= cmp["RTS"].diff <= cmp["RTS"].high
+    assert mcnemar_exact(0, 10) == pytest.approx(2 / 1024)
+    assert mcnemar_exact(4, 4) == 1.0
+
+    # Reports written before attack_id was recorded repeat episode ids across
+    # attack variants: refuse to pair them rather than silently dropping episodes.
+    from apig.report import episode_to_dict, iter_report_episodes
+
+    def legacy_report(name, results):
+        episodes = [{k: v for k, v in episode_to_dict(r).items() if not k.startswith("attack_")} for r in results]
+        path = tmp_path / name
+        path.write_text(json.dumps({"summary": {}, "episodes": episodes}))
+        return str(path)
+
+    old_a, old_b = legacy_report("a.json", naive), legacy_report("b.json", rule)
+    with pytest.raises(ValueError, match="A has .* lacks attack_id"):
+        paired_outcomes(iter_report_episodes(old_a), iter_report_episodes(old_b))
+    with pytest.raises(ValueError, match="B has"):
+        paired_outcomes(rule, iter_report_episodes(old_b))
